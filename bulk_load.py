@@ -1,16 +1,19 @@
 import os
+import sys
 import argparse
-import requests
-import re
 
 import time
 from datetime import timedelta
+from bulk_scheduler import CountryRun, physical_memory, run_countries
+from downloads import Downloader, FASTTEXT_URL, GEOFABRIK_URL, geofabrik_urls
+import fasttext_store
 
 parser = argparse.ArgumentParser()
 group_fasttext = parser.add_mutually_exclusive_group(required=True)
 group_fasttext.add_argument('--download_fasttext', action='store_true', default=False, help='toggle direct download of fasttext from fbai')
-group_fasttext.add_argument('--fasttext_file', type=str, help='location of fasttext binaries')
+group_fasttext.add_argument('--fasttext_file', type=str, help='location of fasttext binaries or of a vector store compiled with fasttext_store.py')
 
+parser.add_argument('--fasttext_store', type=str, default='data/fasttext_store', help='directory to compile the fasttext binaries to, the vector store shared by all runs')
 parser.add_argument('--from_directory', type=str, default='', help='run on directory of pbf files instead of downloading from geofabrik')
 
 continent_arg = parser.add_argument('--geofabrik_continent', type=str, help='geofabrik continent prefix to use')
@@ -20,14 +23,23 @@ group_countries.add_argument('--use_predefined', action='store_true', default=Fa
 
 parser.add_argument('--output_directory', type=str, required=True, help='Target directory for storing resulting ttl files.')
 parser.add_argument('--cut_off', default=1.5, type=float, help='minimum score to achieve for predicted links to be considered')
+parser.add_argument('--base_url', type=str, default=GEOFABRIK_URL, help='address of geofabrik or of a mirror with the same layout')
+parser.add_argument('--fasttext_url', type=str, default=FASTTEXT_URL, help='address of the fasttext binaries to download')
+parser.add_argument('--download_workers', type=int, default=2, help='number of files downloaded at the same time')
+parser.add_argument('--work_directory', type=str, default='data/countries', help='directory holding the data directory and log file of every country')
+parser.add_argument('--cpu_budget', type=int, default=os.cpu_count(), help='number of processes all concurrent country runs may use together')
+parser.add_argument('--memory_budget', type=int, default=physical_memory() * 4 // 5, help='memory in MB all concurrent country runs may use together')
+parser.add_argument('--country_workers', type=int, default=1, help='number of processes used by every country run')
+parser.add_argument('--base_memory', type=int, default=2560, help='estimated memory in MB of a country run without its data, including the memory budget of match_entities.py')
+parser.add_argument('--memory_factor', type=float, default=8.0, help='estimated memory in MB per MB of pbf file of a country run')
 args = parser.parse_args()
 
 
 if args.from_directory:
     countries = []
-    for s in os.listdir(args.from_directory):
-        if re.match(r'-latest.osm.pbf$', s):
-            countries.append(s.replace(r'-latest.osm.pbf$', ''))
+    for s in sorted(os.listdir(args.from_directory)):
+        if s.endswith('-latest.osm.pbf'):
+            countries.append(s[:-len('-latest.osm.pbf')])
     print('found the following pbf files:', countries)
 else:
     if args.use_predefined:
@@ -50,25 +62,31 @@ else:
     else:
         countries = args.custom_countries
 
-    # Dowload Files first to make sure no geofabrik references are wrong
-    print('Bulk Download Started:')
-    for country in countries:
-        print(f'Downloading OSM File: {country}')
-        r = requests.get(f'https://download.geofabrik.de/{args.geofabrik_continent}/{country}-latest.osm.pbf')
-        with open(f'{os.path.basename(country)}-latest.osm.pbf', 'wb') as f:
-            f.write(r.content)
-        print(f'- finished download {country}')
-
-# download fasttext binaries
+# pbf files and fasttext binaries are streamed to disk in the background, countries are processed as soon as their
+# file is downloaded and verified against the md5 file of geofabrik
+downloader = Downloader(workers=args.download_workers)
 if args.download_fasttext:
     print('- downloading fasttext binaries')
-    r = requests.get('https://dl.fbaipublicfiles.com/fasttext/vectors-crawl/cc.en.300.bin.gz')
-    with open('cc.en.300.bin.gz', 'wb') as f:
-        f.write(r.content)
-    print('- finished download')
-    ft_file = 'cc.en.300.bin.gz'
-else:
-    ft_file = args.fasttext_file
+    ft_download = downloader.submit(args.fasttext_url, os.path.basename(args.fasttext_url))
+
+pbf_files, sizes, downloads = {}, {}, {}
+for country in countries:
+    pbf_files[country] = os.path.join(args.from_directory, f'{country}-latest.osm.pbf')
+    if args.from_directory:
+        sizes[country] = os.path.getsize(pbf_files[country])
+    else:
+        # asking for the sizes first makes sure no geofabrik references are wrong before anything is processed
+        url, md5_url = geofabrik_urls(f'{args.geofabrik_continent}/{country}' if args.geofabrik_continent else country, args.base_url)
+        sizes[country] = downloader.size(url)
+        downloads[country] = (url, md5_url)
+if downloads:
+    print('Bulk Download Started:')
+    # the largest countries take longest to process, they are downloaded first
+    for country in sorted(downloads, key=sizes.get, reverse=True):
+        url, md5_url = downloads[country]
+        downloads[country] = downloader.submit(url, pbf_files[country], md5_url)
+
+ft_file = ft_download.result() if args.download_fasttext else args.fasttext_file
 
 
 start = time.time()
@@ -77,9 +95,35 @@ if not os.path.exists('data/'):
     print('- creating data directory')
     os.makedirs('data')
 
-for pos, country in enumerate(countries):
-    print(f'bulk running: {country} {pos+1}/{len(countries)}')
-    os.system(f"python worldkg.py --fasttext_file {ft_file} --input_file {os.path.join(args.from_directory, f'{country}-latest.osm.pbf')} --output_file {os.path.join(args.output_directory, f'{country}.ttl')}")
+# compile the fasttext binary once, every run opens the memory mapped store instead of loading the binary
+# a failed compile raises here, before any country is started
+if os.path.isdir(ft_file):
+    store_dir = ft_file
+    print(f'- using the compiled vector store {store_dir}')
+else:
+    store_dir = args.fasttext_store
+    fasttext_store.main(['--fasttext_file', ft_file, '--store_dir', store_dir])
+
+# every country runs in its own process and data directory, the memory mapped store and the match cache are shared
+# by all of them
+os.makedirs(args.work_directory, exist_ok=True)
+os.makedirs(args.output_directory, exist_ok=True)
+runs = []
+for country in countries:
+    command = [sys.executable, 'worldkg.py', '--fasttext_file', store_dir, '--input_file', pbf_files[country],
+               '--output_file', os.path.join(args.output_directory, f'{country}.ttl'), '--cut_off', str(args.cut_off),
+               '--data_dir', os.path.join(args.work_directory, country), '--workers', str(args.country_workers),
+               '--match_cache', os.path.join(args.work_directory, 'match_cache.sqlite')]
+    memory = int(args.base_memory + args.memory_factor * sizes[country] / 2**20)
+    runs.append(CountryRun(country, command, args.country_workers, memory, os.path.join(args.work_directory, f'{country}.log'),
+                           download=downloads.get(country)))
+
+print(f'bulk running {len(runs)} countries with {args.cpu_budget} cpus and {args.memory_budget} MB:')
+finished = run_countries(runs, args.cpu_budget, args.memory_budget)
+failed = [country for country, code, _ in finished if code != 0]
+if failed:
+    print(f'- failed countries: {failed}')
+downloader.close()
 
 end = time.time()
 print(f"- Total bulkload runtime: {timedelta(seconds=end - start)}")
\ No newline at end of file
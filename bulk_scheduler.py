@@ -0,0 +1,85 @@
+import os
+import subprocess
+import time
+from datetime import timedelta
+
+
+def physical_memory() -> int:
+    """
+    :return: size of the physical memory in MB
+    """
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // 2**20
+
+
+class CountryRun:
+    """
+    a country processed by its own worldkg.py process
+    """
+    def __init__(self, name: str, command: list, cpus: int, memory: int, log_file: str, download=None):
+        """
+        :param name: name of the country
+        :param command: command line starting the run
+        :param cpus: number of processes the run uses
+        :param memory: estimated peak memory of the run in MB
+        :param log_file: file receiving the output of the run
+        :param download: optional future of the download of the input file, the run is not started before it is done
+        """
+        self.name = name
+        self.command = command
+        self.cpus = cpus
+        self.memory = memory
+        self.log_file = log_file
+        self.download = download
+        self.process = None
+        self.start = None
+
+
+def run_countries(runs: list, cpu_budget: int, memory_budget: int, poll_interval: float = 0.5) -> list:
+    """
+    run countries concurrently within cpu and memory budgets
+    waiting runs are started largest first, and the remaining budget is filled with the largest runs that still fit,
+    so small countries are packed alongside large ones. a run exceeding the budgets on its own is started when
+    nothing else is running. runs waiting for their download are passed over until it is done, so countries are
+    processed while the next ones are downloaded.
+    :param runs: list of CountryRun objects
+    :param cpu_budget: number of processes all runs may use together
+    :param memory_budget: memory in MB all runs may use together
+    :param poll_interval: seconds between checks for finished runs
+    :return: list of (country, return code, runtime in seconds) in the order the runs finished, the return code is
+             None if the download failed
+    """
+    waiting = sorted(runs, key=lambda run: (run.memory, run.cpus), reverse=True)
+    running = []
+    finished = []
+    while waiting or running:
+        free_cpus = cpu_budget - sum(run.cpus for run in running)
+        free_memory = memory_budget - sum(run.memory for run in running)
+        for run in list(waiting):
+            if run.download is not None and not run.download.done():
+                continue
+            if run.download is not None and run.download.exception() is not None:
+                waiting.remove(run)
+                finished.append((run.name, None, 0.0))
+                print(f'- {run.name} failed to download: {run.download.exception()} ({len(finished)}/{len(runs)})')
+                continue
+            if running and (run.cpus > free_cpus or run.memory > free_memory):
+                continue
+            with open(run.log_file, 'w') as log:
+                run.process = subprocess.Popen(run.command, stdout=log, stderr=subprocess.STDOUT)
+            run.start = time.time()
+            waiting.remove(run)
+            running.append(run)
+            free_cpus -= run.cpus
+            free_memory -= run.memory
+            print(f'- started {run.name}: {run.cpus} cpus, {run.memory} MB estimated, {len(running)} running, {len(waiting)} waiting')
+
+        time.sleep(poll_interval)
+        for run in list(running):
+            if run.process.poll() is None:
+                continue
+            running.remove(run)
+            seconds = time.time() - run.start
+            finished.append((run.name, run.process.returncode, seconds))
+            state = 'finished' if run.process.returncode == 0 else f'failed with code {run.process.returncode}, see {run.log_file}'
+            print(f'- {run.name} {state} after {timedelta(seconds=seconds)} ({len(finished)}/{len(runs)})')
+    return finished
@@ -0,0 +1,50 @@
+import argparse
+import numpy as np
+import pandas as pd
+
+
+def compare_matches(reference: pd.DataFrame, comparison: pd.DataFrame, cut_off: float = 1.5) -> dict:
+    """
+    compare two match files of the same subjects, e.g. of float and quantized label embeddings
+    :param reference: matches used as ground truth
+    :param comparison: matches to compare
+    :param cut_off: minimum score for links to be added by update_graph.py
+    :return: dictionary of statistics
+    """
+    keys = ['s', 'p', 'literal']
+    if len(reference) != len(comparison) or not (reference[keys].to_numpy() == comparison[keys].to_numpy()).all():
+        raise ValueError('match files do not contain the same subjects in the same order')
+    same = reference['o'].to_numpy() == comparison['o'].to_numpy()
+    difference = np.abs(reference['score'].to_numpy() - comparison['score'].to_numpy())
+    accepted = reference['score'].to_numpy() > cut_off
+    accepted_comparison = comparison['score'].to_numpy() > cut_off
+    return {'rows': len(reference),
+            'same_candidate': int(same.sum()),
+            'max_score_difference': float(difference.max()) if len(difference) else 0.0,
+            'mean_score_difference': float(difference.mean()) if len(difference) else 0.0,
+            'accepted': int(accepted.sum()),
+            'accepted_comparison': int(accepted_comparison.sum()),
+            # links that are added by only one of the files, or added with a different candidate
+            'changed_links': int((accepted != accepted_comparison).sum() + (accepted & accepted_comparison & ~same).sum())}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--reference', type=str, default='data/uslp-triplets.csv', help='matches computed with float embeddings')
+    parser.add_argument('--comparison', type=str, default='data/uslp-triplets-q8.csv', help='matches computed with quantized embeddings')
+    parser.add_argument('--cut_off', default=1.5, type=float, help='minimum score to achieve for links to be added')
+    args = parser.parse_args()
+
+    print('Comparing matches:')
+    reference = pd.read_csv(args.reference, sep='\t', keep_default_na=False)
+    comparison = pd.read_csv(args.comparison, sep='\t', keep_default_na=False)
+    stats = compare_matches(reference, comparison, args.cut_off)
+    rows = max(1, stats['rows'])
+    print(f"- {stats['rows']} subjects compared")
+    print(f"- same best candidate for {stats['same_candidate']} subjects ({stats['same_candidate'] / rows * 100:.2f}%)")
+    print(f"- score difference mean {stats['mean_score_difference']:.2e} max {stats['max_score_difference']:.2e}")
+    print(f"- links above cut off {args.cut_off}: {stats['accepted']} in reference, {stats['accepted_comparison']} in comparison, {stats['changed_links']} changed")
+
+
+if __name__ == '__main__':
+    main()
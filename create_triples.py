@@ -1,80 +1,99 @@
 import osmium
-import pandas as pd
+import osmium.filter
+from osmium.osm import osm_entity_bits
 import re
 import sys
 import urllib
 import time
 from rdflib import Graph, Namespace, URIRef, Literal
+from triple_writer import TurtleLineWriter
 from tqdm import tqdm
 from datetime import timedelta
 import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pbf_blocks import read_blob_index, read_blocks
+from tag_mapping import TagMapping
+from entity_tables import EntityTableBuilder, finalize, read_classes, read_relations, write_tables
+import pandas as pd
 
 class osm2rdf_handler(osmium.SimpleHandler):
-    def __init__(self, feature_file:str, key_file:str, min_tags:int):
+    def __init__(self, feature_file:str, key_file:str, min_tags:int, output_file:str=None, position:int=0,
+                 mapping_cache:str=None, relevant_keys_only:bool=False, progress_interval:int=10000,
+                 append:bool=False, classes:list=None, relations:list=None):
         osmium.SimpleHandler.__init__(self)
-        self.pbar = tqdm(desc='- Processing Nodes')
+        self.pbar = tqdm(desc='- Processing Nodes', position=position)
         self.counts = 0
+        # ways and areas that became entities, counts includes the ones without enough tags
+        self.created = 0
+        self.progress_interval = progress_interval
+        # nodes are handled in the first pass, ways and areas in a separate pass, see apply_ways
+        self.entities = osm_entity_bits.NODE
 
         # prepare Graph namespace
-        self.g = Graph()
-        self.graph = self.g
         self.wd = Namespace("http://www.wikidata.org/wiki/")
-        self.g.bind("wd", self.wd)
         self.wdt = Namespace("http://www.wikidata.org/prop/direct/")
-        self.g.bind("wdt", self.wdt)
         self.wkg = Namespace("http://worldkg-dsis.iai.uni-bonn.de:8894/resource/")
-        self.g.bind("wkg", self.wkg)
         self.wkgs = Namespace("http://worldkg-dsis.iai.uni-bonn.de:8894/schema/")
-        self.g.bind("wkgs", self.wkgs)
         self.geo = Namespace("http://www.opengis.net/ont/geosparql#")
-        self.g.bind("geo", self.geo)
         self.rdfs = Namespace('http://www.w3.org/2000/01/rdf-schema#')
-        self.g.bind("rdfs", self.rdfs)
         self.rdf = Namespace('http://www.w3.org/1999/02/22-rdf-syntax-ns#')
-        self.g.bind('rdf', self.rdf)
         self.ogc = Namespace("http://www.opengis.net/rdf#")
-        self.g.bind('ogc', self.ogc)
         self.sf = Namespace("http://www.opengis.net/ont/sf#")
-        self.g.bind('sf', self.sf)
         self.osmn = Namespace("https://www.openstreetmap.org/node/")
-        self.g.bind("osmn", self.osmn)
+        self.osmw = Namespace("https://www.openstreetmap.org/way/")
+        self.osmr = Namespace("https://www.openstreetmap.org/relation/")
+        namespaces = {'wd': self.wd, 'wdt': self.wdt, 'wkg': self.wkg, 'wkgs': self.wkgs, 'geo': self.geo,
+                      'rdfs': self.rdfs, 'rdf': self.rdf, 'ogc': self.ogc, 'sf': self.sf, 'osmn': self.osmn,
+                      'osmw': self.osmw, 'osmr': self.osmr}
 
-        self.namespace = {key: uri for key, uri in self.g.namespaces()}
+        if output_file is None:
+            # collect triples in memory and serialize them at the end
+            self.g = Graph()
+            for prefix, uri in namespaces.items():
+                self.g.bind(prefix, uri)
+            self.namespace = {key: uri for key, uri in self.g.namespaces()}
+        else:
+            # write triples to output_file while the pbf file is read
+            self.g = TurtleLineWriter(output_file, namespaces, append=append)
+            self.namespace = {key: URIRef(uri) for key, uri in namespaces.items()}
+        self.graph = self.g
 
-        # load osm features and keys
-        self.supersub = pd.read_csv(feature_file, sep='\t', encoding='utf-8')
-        self.key_list = pd.read_csv(key_file, sep='\t', encoding='utf-8')
-        self.key_list = list(self.key_list['key'])
-        self.supersub = self.supersub.drop_duplicates()
-        
-        self.dict_class = self.supersub.groupby('key')['value'].apply(list).reset_index(name='subclasses').set_index('key').to_dict()['subclasses']
+        # optionally collect candidate and subject tables while the triples are created
+        self.entity_tables = None
+        if classes is not None and relations is not None:
+            self.entity_tables = EntityTableBuilder(self.namespace['wkgs'], classes, relations, contiguous=True)
+
+        # resolve osm tags to schema uris through precompiled dictionaries
+        self.mapping = TagMapping.load(feature_file, key_file, mapping_cache)
+        self.class_uris = {kv: self.namespace['wkgs'] + c for kv, c in self.mapping.classes.items()}
+        self.yes_class_uris = {k: self.namespace['wkgs'] + c for k, c in self.mapping.yes_classes.items()}
+        self.predicate_uris = {k: self.namespace['wkgs'] + p for k, p in self.mapping.predicates.items()}
+        self.instanceOf = self.namespace['rdf'] + 'type'
 
         self.min_tags = min_tags
-    
-    def to_camel_case_class(self, word):
-        word = word.replace(':', '_')
-        return ''.join(x.capitalize() or '_' for x in word.split('_'))
-    
-    def to_camel_case_classAppend(self, key, val):
-        return self.supersub.loc[(self.supersub['value'] == val) & (self.supersub['key'] == key)]['appendedClass'].values[0]
-    
-    def to_camel_case_key(self, input_str):
-        input_str = input_str.replace(':', '_')
-        words = input_str.split('_')
-        return words[0] + "".join(x.title() for x in words[1:])
-    
+
+        # filters run in libosmium before objects are handed to python
+        # untagged nodes can never exceed min_tags, so dropping them does not change the output
+        self.filters = [osmium.filter.EmptyTagFilter()] if min_tags >= 0 else []
+        if relevant_keys_only:
+            # only nodes carrying at least one key that produces a class or property reach python
+            keys = set(self.yes_class_uris) | set(self.predicate_uris) | {'name', 'wikidata', 'wikipedia'}
+            self.filters.append(osmium.filter.KeyFilter(*sorted(keys)))
+
+    def add(self, triple:tuple) -> None:
+        self.g.add(triple)
+        if self.entity_tables is not None:
+            self.entity_tables.add(triple)
+
     def printTriple(self, s, p, o):
-        if p in self.dict_class: 
-            if o in self.dict_class[p]:
-                rel = self.namespace['wkg'] + s
-                instanceOf = self.namespace['rdf'] + 'type'
-                res = self.namespace['wkgs'] + self.to_camel_case_classAppend(p, o)
-                self.g.add((rel, instanceOf, res))
+        if p in self.yes_class_uris:
+            res = self.class_uris.get((p, o))
+            if res is not None:
+                self.add((self.namespace['wkg'] + s, self.instanceOf, res))
             if o == 'Yes':
-                rel = self.namespace['wkg'] + s
-                instanceOf = self.namespace['rdf'] + 'type'
-                res = self.namespace['wkgs'] + self.to_camel_case_class(p)
-                self.g.add((rel, instanceOf, res))
+                self.add((self.namespace['wkg'] + s, self.instanceOf, self.yes_class_uris[p]))
         else:
             if p=='Point':
                 sub = self.namespace['wkg'] + s
@@ -82,18 +101,18 @@ class osm2rdf_handler(osmium.SimpleHandler):
                 geoobj = self.namespace['wkg'] + 'geo' + s
                 prop = self.namespace['sf'] + 'Point'
                 typ = self.namespace['rdf'] + 'type'
-                self.g.add((sub, geoprop, geoobj))
-                self.g.add((geoobj, typ, prop))
-                self.g.add((geoobj, self.geo["asWKT"], Literal(o, datatype=self.geo.wktLiteral)))
+                self.add((sub, geoprop, geoobj))
+                self.add((geoobj, typ, prop))
+                self.add((geoobj, self.geo["asWKT"], Literal(o, datatype=self.geo.wktLiteral)))
             elif p == 'osmLink':
                 sub = self.namespace['wkg'] + s
                 prop = self.namespace['wkgs'] + 'osmLink'
                 obj = self.namespace['osmn'] + o
-                self.g.add((sub, prop, obj))
+                self.add((sub, prop, obj))
             elif p == 'name':
                 sub = self.namespace['wkg'] + s
                 prop = self.namespace['rdfs'] + 'label'
-                self.g.add((sub, prop, Literal(o)))
+                self.add((sub, prop, Literal(o)))
             elif p == 'wikidata':
                 sub = self.namespace['wkg'] + s
                 prop = self.namespace['wkgs'] + p
@@ -101,7 +120,7 @@ class osm2rdf_handler(osmium.SimpleHandler):
                     obj = self.namespace['wd'] + o
                 else:
                     obj = Literal(o)
-                self.g.add((sub, prop, obj))
+                self.add((sub, prop, obj))
             elif p == 'wikipedia':
                 sub = self.namespace['wkg'] + s
                 prop = self.namespace['wkgs'] + 'wikipedia'
@@ -114,67 +133,384 @@ class osm2rdf_handler(osmium.SimpleHandler):
                 url = country+'.wikipedia.org/wiki/'+country+':'+ids
                 url = 'https://'+urllib.parse.quote(url)
                 obj = URIRef(url)
-                self.g.add((sub, prop, obj))
+                self.add((sub, prop, obj))
             else:
-                if p in self.key_list:
+                prop = self.predicate_uris.get(p)
+                if prop is not None:
                     sub = self.namespace['wkg'] + s
-                    prop = self.namespace['wkgs'] + self.to_camel_case_key(p)
-                    self.g.add((sub, prop, Literal(o)))
+                    self.add((sub, prop, Literal(o)))
         
     def __close__(self):
         print(str(self.counts))
 
+    def close_progress(self) -> None:
+        self.pbar.update(self.counts - self.pbar.n)
+        self.pbar.close()
+
+    def enabled_for(self):
+        return self.entities
+
+    def printEntity(self, id:str, point:str, tags, link:URIRef) -> None:
+        """
+        create triples for the location, osm link and tags of an osm object
+        :param id: identifier of the entity within the wkg namespace
+        :param point: location encoded in wkt format
+        :param tags: tags of the osm object
+        :param link: uri of the object on openstreetmap.org
+        """
+        self.printTriple(id, "Point", point)
+        self.add((self.namespace['wkg'] + id, self.namespace['wkgs'] + 'osmLink', link))
+
+        for k, v in tags:
+
+            val = str(v)
+
+            val = val.replace("\\", "\\\\")
+            val = val.replace('"', '\\"')
+            val = val.replace('\n', " ")
+
+            k = k.replace(" ", "")
+
+            self.printTriple(id, k, val)
+
+    def update_progress(self) -> None:
+        # updating tqdm for every object is costly, report progress in batches
+        self.counts += 1
+        if self.counts % self.progress_interval == 0:
+            self.pbar.update(self.progress_interval)
+
     def node(self, n):
-        self.pbar.update(1)
+        self.update_progress()
         if len(n.tags) > self.min_tags:
             id = str(n.id)
+            point = 'Point('+str(n.location.lon)+' '+str(n.location.lat)+')'
+            self.printEntity(id, point, n.tags, self.namespace['osmn'] + id)
 
+    def way(self, w):
+        self.update_progress()
+        if len(w.tags) > self.min_tags:
+            locations = [(n.lon, n.lat) for n in w.nodes if n.location.valid()]
+            if locations:
+                if w.is_closed() and len(locations) > 3:
+                    lon, lat = polygon_centroid([locations], [])
+                else:
+                    # a node in the middle of the line lies on the feature, unlike the centroid of a curved line
+                    lon, lat = locations[len(locations) // 2]
+                id = 'way' + str(w.id)
+                self.created += 1
+                self.printEntity(id, wkt_point(lon, lat), w.tags, self.namespace['osmw'] + str(w.id))
 
+    def area(self, a):
+        # areas from closed ways have already been handled in way
+        if a.from_way():
+            return
+        self.update_progress()
+        if len(a.tags) > self.min_tags:
+            outer, inner = [], []
+            for ring in a.outer_rings():
+                outer.append([(n.lon, n.lat) for n in ring])
+                inner.extend([(n.lon, n.lat) for n in inner_ring] for inner_ring in a.inner_rings(ring))
+            if outer:
+                lon, lat = polygon_centroid(outer, inner)
+                id = 'relation' + str(a.orig_id())
+                self.created += 1
+                self.printEntity(id, wkt_point(lon, lat), a.tags, self.namespace['osmr'] + str(a.orig_id()))
 
-            point = 'Point('+str(n.location.lon)+' '+str(n.location.lat)+')'
+    def apply_ways(self, input_file:str, location_index:str) -> None:
+        """
+        second pass creating entities from tagged ways and multipolygon relations
+        node locations are kept in the given osmium index, file based indices keep memory use low
+        :param input_file: pbf file to read
+        :param location_index: osmium index type, optionally followed by a file name, e.g. sparse_file_array,nodes.bin
+        """
+        self.pbar.close()
+        self.pbar = tqdm(desc='- Processing Ways and Areas')
+        self.counts = 0
+        self.created = 0
+        self.entities = osm_entity_bits.WAY | osm_entity_bits.AREA
+        # relations have to pass the filters to be assembled into areas, nodes only feed the location index
+        filters = self.filters + [osmium.filter.EntityFilter(osm_entity_bits.WAY | osm_entity_bits.AREA | osm_entity_bits.RELATION)]
+        self.apply_file(input_file, locations=True, idx=location_index, filters=filters)
+        self.entities = osm_entity_bits.NODE
+
+
+def wkt_point(lon:float, lat:float) -> str:
+    return 'Point('+str(round(lon, 7))+' '+str(round(lat, 7))+')'
+
+
+def ring_area_centroid(ring:list) -> tuple:
+    """
+    compute area and centroid of a closed ring with the shoelace formula
+    :param ring: list of (lon, lat) tuples, first and last element are equal
+    :return: absolute area and centroid as (lon, lat) tuple
+    """
+    # shift coordinates to the first point for numerical stability
+    x0, y0 = ring[0]
+    area = cx = cy = 0.0
+    for (xa, ya), (xb, yb) in zip(ring, ring[1:]):
+        xa, ya, xb, yb = xa - x0, ya - y0, xb - x0, yb - y0
+        cross = xa * yb - xb * ya
+        area += cross
+        cx += (xa + xb) * cross
+        cy += (ya + yb) * cross
+    if area == 0:
+        return 0.0, (x0, y0)
+    return abs(area) / 2, (x0 + cx / (3 * area), y0 + cy / (3 * area))
+
+
+def polygon_centroid(outer:list, inner:list) -> tuple:
+    """
+    centroid of a polygon with holes, falls back to the mean of the outer vertices for degenerate polygons
+    :param outer: list of outer rings
+    :param inner: list of inner rings
+    :return: centroid as (lon, lat) tuple
+    """
+    total = lon = lat = 0.0
+    for rings, sign in [(outer, 1), (inner, -1)]:
+        for ring in rings:
+            area, (x, y) = ring_area_centroid(ring)
+            total += sign * area
+            lon += sign * area * x
+            lat += sign * area * y
+    if total <= 0:
+        # the closing point repeats the first one and would weigh it twice
+        vertices = [point for ring in outer for point in (ring[:-1] if len(ring) > 1 and ring[0] == ring[-1] else ring)]
+        return sum(x for x, _ in vertices) / len(vertices), sum(y for _, y in vertices) / len(vertices)
+    return lon / total, lat / total
+
+def process_shard(task: dict) -> dict:
+    """
+    worker function converting a subset of pbf blocks into one shard file
+    :param task: dictionary containing input file, block chunks, shard file and handler settings
+    :return: manifest entries for the chunks written to the shard
+    """
+    h = osm2rdf_handler(task['osm_features'], task['key_list'], task['min_tags'], output_file=task['shard_file'],
+                        position=task['position'], mapping_cache=task['mapping_cache'],
+                        relevant_keys_only=task['relevant_keys_only'], classes=task['classes'],
+                        relations=task['relations'])
+    chunks = []
+    for index, blocks in task['chunks']:
+        if h.entity_tables is not None:
+            # the last entity of the previous chunk is still pending in contiguous mode
+            h.entity_tables.flush()
+            h.entity_tables.chunk = index
+        start_offset = h.graph.tell()
+        h.apply_buffer(read_blocks(task['input_file'], task['header'], blocks), 'pbf', filters=h.filters)
+        chunks.append({'index': index, 'shard': task['shard_file'], 'start': start_offset, 'end': h.graph.tell()})
+    h.close_progress()
+    h.graph.close()
+    tables = []
+    if h.entity_tables is not None:
+        for name, frame in zip(['candidates', 'subjects'], h.entity_tables.frames()):
+            tables.append(f"{task['shard_file']}.{name}.parquet")
+            frame.to_parquet(tables[-1], engine='pyarrow')
+    return {'shard': task['shard_file'], 'triples': h.graph.count, 'chunks': chunks, 'tables': tables}
+
+
+def create_shards(args, classes:list=None, relations:list=None) -> str:
+    """
+    split the pbf file into chunks of blocks and convert them in a process pool
+    :param args: parsed command line arguments
+    :param classes: relevant candidate classes, if entity tables are collected
+    :param relations: spatial relations, if entity tables are collected
+    :return: location of the written manifest file
+    """
+    header, blocks = read_blob_index(args.input_file)
+    chunks = [(i, blocks[pos:pos + args.blocks_per_chunk]) for i, pos in enumerate(range(0, len(blocks), args.blocks_per_chunk))]
+    print(f'- splitting {len(blocks)} blocks into {len(chunks)} chunks for {args.workers} workers')
+
+    os.makedirs(args.shard_dir, exist_ok=True)
+    if args.mapping_cache:
+        # compile once before the workers read the cache
+        TagMapping.load(args.osm_features, args.key_list, args.mapping_cache)
+    # interleave chunks so that every worker gets a share of nodes, ways and relations
+    tasks = [{'input_file': args.input_file, 'header': header, 'chunks': chunks[w::args.workers],
+              'shard_file': os.path.join(args.shard_dir, f'shard{w}.ttl'), 'position': w,
+              'osm_features': args.osm_features, 'key_list': args.key_list, 'min_tags': args.min_tags,
+              'mapping_cache': args.mapping_cache, 'relevant_keys_only': args.relevant_keys_only,
+              'classes': classes, 'relations': relations}
+             for w in range(args.workers)]
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        shards = list(executor.map(process_shard, tasks))
 
-            self.printTriple(id, "Point", point)
-            self.printTriple(id, "osmLink", id)
+    manifest = {'input_file': args.input_file,
+                'shards': [shard['shard'] for shard in shards],
+                'triples': sum(shard['triples'] for shard in shards),
+                'tables': [shard['tables'] for shard in shards],
+                'chunks': sorted([c for shard in shards for c in shard['chunks']], key=lambda c: c['index'])}
+    manifest_file = os.path.join(args.shard_dir, 'manifest.json')
+    with open(manifest_file, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f'- wrote {manifest["triples"]} triples to {len(shards)} shards, manifest: {manifest_file}')
+    return manifest_file
 
-            for k, v in n.tags:
 
-                val = str(v)
+def merge_shards(manifest_file: str, output_file: str) -> int:
+    """
+    concatenate shards in block order, producing the same output as a single process run
+    :param manifest_file: manifest written by create_shards
+    :param output_file: file to write merged triples to
+    :return: number of merged triples
+    """
+    with open(manifest_file, 'r') as f:
+        manifest = json.load(f)
+    with open(output_file, 'wb') as target:
+        # all shards share the same prefix header
+        with open(manifest['shards'][0], 'rb') as source:
+            target.write(source.read(manifest['chunks'][0]['start'] if manifest['chunks'] else -1))
+        for chunk in tqdm(manifest['chunks'], desc='- Merging shards'):
+            with open(chunk['shard'], 'rb') as source:
+                source.seek(chunk['start'])
+                remaining = chunk['end'] - chunk['start']
+                while remaining > 0:
+                    b = source.read(min(remaining, 1 << 20))
+                    target.write(b)
+                    remaining -= len(b)
+    return manifest['triples']
 
-                val = val.replace("\\", "\\\\")
-                val = val.replace('"', '\\"')
-                val = val.replace('\n', " ")
 
-                k = k.replace(" ", "")
+def read_shard_tables(manifest_file: str) -> list:
+    """
+    load the entity tables written by the workers
+    :param manifest_file: manifest written by create_shards
+    :return: list of (candidates, subjects) frames per shard
+    """
+    with open(manifest_file, 'r') as f:
+        manifest = json.load(f)
+    return [tuple(pd.read_parquet(table) for table in tables) for tables in manifest.get('tables', []) if tables]
 
-                self.printTriple(id, k, val)
 
-start = time.time()
+def remove_shards(manifest_file: str) -> None:
+    """
+    delete shard files and manifest once they have been merged
+    :param manifest_file: manifest written by create_shards
+    """
+    with open(manifest_file, 'r') as f:
+        manifest = json.load(f)
+    for shard in manifest['shards']:
+        os.remove(shard)
+    for tables in manifest.get('tables', []):
+        for table in tables:
+            os.remove(table)
+    os.remove(manifest_file)
+    if not os.listdir(os.path.dirname(manifest_file)):
+        os.rmdir(os.path.dirname(manifest_file))
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--osm_features', type=str, default='required files/OSM_Ontology_map_features.csv')
-parser.add_argument('--key_list', type=str, default='required files/Key_List.csv')
-parser.add_argument('--output_file', type=str, default='data/graph.ttl')
-parser.add_argument('--input_file', type=str, required=True)
-parser.add_argument('--min_tags', type=int, default=2)
 
-args = parser.parse_args()
+def main(argv: list = None) -> None:
+    start = time.time()
 
-try:
-    with open(args.output_file, 'w') as file:
-        pass
-except IOError as err:
-    sys.exit(f'can not write to {args.output_file}')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--osm_features', type=str, default='required files/OSM_Ontology_map_features.csv')
+    parser.add_argument('--key_list', type=str, default='required files/Key_List.csv')
+    parser.add_argument('--output_file', type=str, default='data/graph.ttl')
+    parser.add_argument('--input_file', type=str)
+    parser.add_argument('--min_tags', type=int, default=2)
+    parser.add_argument('--mapping_cache', type=str, help='location to cache the compiled tag mapping at')
+    parser.add_argument('--relevant_keys_only', action='store_true', default=False, help='drop nodes without any key from the key list or map features before they reach python')
+    parser.add_argument('--output_mode', type=str, default='stream', choices=['stream', 'graph'], help='stream writes flat turtle while reading, graph builds an rdflib graph and serializes it at the end')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes converting blocks of the pbf file in parallel')
+    parser.add_argument('--blocks_per_chunk', type=int, default=16, help='number of pbf blocks a worker converts at once')
+    parser.add_argument('--shard_dir', type=str, default='data/shards', help='directory for shard files and their manifest')
+    parser.add_argument('--keep_shards', action='store_true', default=False, help='only write shards and manifest, do not merge them')
+    parser.add_argument('--merge_manifest', type=str, help='merge the shards of an existing manifest into output_file')
+    parser.add_argument('--with_ways', action='store_true', default=False, help='also create entities from tagged ways and multipolygon relations')
+    parser.add_argument('--location_index', type=str, default='sparse_file_array', help='osmium index type storing node locations for ways, file arrays are memory mapped from location_file')
+    parser.add_argument('--location_file', type=str, default='data/node_locations.bin', help='file backing file array location indices')
+    parser.add_argument('--entity_tables', action='store_true', default=False, help='write the candidate and subject tables of generate_entities.py while creating triples')
+    parser.add_argument('--candidate_file', type=str, default='data/candidates.parquet.zip')
+    parser.add_argument('--subject_file', type=str, default='data/subjects.parquet.zip')
+    parser.add_argument('--relation_file', default='required files/relations.csv', type=str, help='file containing spatial predicates to predict matches for')
+    parser.add_argument('--class_file', default='required files/relevant_classes.csv', type=str, help='file containing all types relevant for candidates')
+
+    args = parser.parse_args(argv)
+
+    if not args.input_file and not args.merge_manifest:
+        parser.error('either --input_file or --merge_manifest is required')
+    if args.workers > 1 and args.output_mode == 'graph':
+        parser.error('--workers requires --output_mode stream')
+    if args.with_ways and args.keep_shards:
+        parser.error('--with_ways can not be combined with --keep_shards, ways are converted after the shards are merged')
+
+    try:
+        with open(args.output_file, 'w') as file:
+            pass
+    except IOError as err:
+        sys.exit(f'can not write to {args.output_file}')
+
+    print('Compute WorldKG Triples:')
+    print(f'- reading from {args.input_file or args.merge_manifest}')
+    print(f'- will write to {args.output_file}')
+
+    classes, relations = None, None
+    if args.entity_tables:
+        classes, relations = read_classes(args.class_file), read_relations(args.relation_file)
+    shard_tables = []
+
+    h = None
+    # triples written by the workers, the way pass appends to them
+    merged_triples = 0
+    node_start = time.time()
+    if args.merge_manifest:
+        merged_triples = merge_shards(args.merge_manifest, args.output_file)
+        shard_tables = read_shard_tables(args.merge_manifest)
+    elif args.workers > 1:
+        manifest_file = create_shards(args, classes, relations)
+        if not args.keep_shards:
+            merged_triples = merge_shards(manifest_file, args.output_file)
+            shard_tables = read_shard_tables(manifest_file)
+            remove_shards(manifest_file)
+    else:
+        h = osm2rdf_handler(args.osm_features, args.key_list, args.min_tags,
+                            output_file=args.output_file if args.output_mode == 'stream' else None,
+                            mapping_cache=args.mapping_cache, relevant_keys_only=args.relevant_keys_only,
+                            classes=classes, relations=relations)
+        h.apply_file(args.input_file, filters=h.filters)
+        h.close_progress()
+    print(f'- node pass: {timedelta(seconds=time.time() - node_start)}')
+
+    if args.with_ways and args.input_file:
+        if h is None:
+            # ways need the locations of all nodes, they are converted in one process after the shards are merged
+            h = osm2rdf_handler(args.osm_features, args.key_list, args.min_tags, output_file=args.output_file,
+                                mapping_cache=args.mapping_cache, relevant_keys_only=args.relevant_keys_only,
+                                append=True, classes=classes, relations=relations)
+            if h.entity_tables is not None:
+                # way rows follow the rows of all node chunks
+                h.entity_tables.chunk = 1 + max([frame['_chunk'].max() for frames in shard_tables for frame in frames if len(frame)], default=0)
+        location_index = args.location_index
+        if location_index.endswith('_file_array'):
+            location_index += f',{args.location_file}'
+        way_start = time.time()
+        h.apply_ways(args.input_file, location_index)
+        h.close_progress()
+        way_time = time.time() - way_start
+        print(f'- way/area pass: {h.created} entities from {h.counts} ways and areas scanned in {timedelta(seconds=way_time)} ({h.counts / max(way_time, 1e-9):.0f} objects/s)')
+        if os.path.exists(args.location_file):
+            os.remove(args.location_file)
+
+    if args.entity_tables and not args.keep_shards:
+        frames = [h.entity_tables.frames()] if h is not None else []
+        candidates = finalize([c for c, _ in shard_tables + frames])
+        subjects = finalize([s for _, s in shard_tables + frames])
+        print(f'- number of candidates: {len(candidates)}')
+        print(f'- number of relations: {len(subjects)}')
+        write_tables(candidates, subjects, args.candidate_file, args.subject_file)
+
+    if h is not None:
+        if args.output_mode == 'stream':
+            h.graph.close()
+            print(f'- wrote {merged_triples + h.graph.count} triples')
+        else:
+            print(f'- writing to {args.output_file}')
+            h.graph.serialize(args.output_file, format="turtle", encoding="utf-8")
+    elif not args.keep_shards:
+        print(f'- wrote {merged_triples} triples')
 
-print('Compute WorldKG Triples:')
-print(f'- reading from {args.input_file}')
-print(f'- will write to {args.output_file}')
+    end = time.time()
 
-h = osm2rdf_handler(args.osm_features, args.key_list, args.min_tags)
-h.apply_file(args.input_file)
-h.pbar.close()
-print(f'- writing to {args.output_file}')
-h.graph.serialize(args.output_file, format="turtle", encoding="utf-8")
+    print(f"- Total runtime: {timedelta(seconds=end - start)}")
 
-end = time.time()
 
-print(f"- Total runtime: {timedelta(seconds=end - start)}")
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+
+GEOFABRIK_URL = 'https://download.geofabrik.de'
+FASTTEXT_URL = 'https://dl.fbaipublicfiles.com/fasttext/vectors-crawl/cc.en.300.bin.gz'
+
+
+def geofabrik_urls(name: str, base_url: str = GEOFABRIK_URL) -> tuple:
+    """
+    :param name: name of the extract, such as europe/liechtenstein or australia-oceania
+    :param base_url: address of geofabrik or of a mirror with the same layout
+    :return: url of the pbf file and url of its md5 file
+    """
+    url = f'{base_url.rstrip("/")}/{name}-latest.osm.pbf'
+    return url, url + '.md5'
+
+
+def file_md5(file: str, chunk_size: int = 1 << 24):
+    """
+    :param file: location of the file
+    :param chunk_size: number of bytes read at once
+    :return: md5 hash object over the content of the file
+    """
+    h = hashlib.md5()
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h
+
+
+class Downloader:
+    """
+    download files to disk in chunks with a pool of connections
+    a download is written to <target>.part and resumed with a range request after a dropped connection or an
+    interrupted run. if an md5 url is given, the file is verified while it is written and only renamed to its target
+    if the checksum matches.
+    """
+    def __init__(self, workers: int = 4, chunk_size: int = 1 << 20, retries: int = 5, timeout: float = 60):
+        """
+        :param workers: number of files downloaded at the same time
+        :param chunk_size: number of bytes written at once
+        :param retries: number of times a failed download is resumed before giving up
+        :param timeout: seconds to wait for the server to connect or send data
+        """
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(workers)
+
+    def size(self, url: str) -> int:
+        """
+        :param url: address of the file
+        :return: size of the file in bytes, 0 if the server does not tell
+        """
+        r = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+        r.raise_for_status()
+        return int(r.headers.get('Content-Length', 0))
+
+    def md5(self, md5_url: str) -> str:
+        """
+        :param md5_url: address of a file in the format of md5sum, like the .md5 files of geofabrik
+        :return: expected hex digest
+        """
+        r = self.session.get(md5_url, timeout=self.timeout)
+        r.raise_for_status()
+        return r.text.split()[0].lower()
+
+    def _fetch(self, url: str, part_file: str) -> str:
+        """
+        append the missing bytes of url to part_file
+        :return: md5 hex digest of the complete part_file
+        """
+        position = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+        h = file_md5(part_file) if position else hashlib.md5()
+        headers = {'Range': f'bytes={position}-'} if position else {}
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as r:
+            if position and r.status_code == 416:
+                # the part file already holds the whole file
+                return h.hexdigest()
+            r.raise_for_status()
+            if position and r.status_code != 206:
+                # the server ignored the range and sends the whole file
+                position, h = 0, hashlib.md5()
+            length = r.headers.get('Content-Length')
+            written = 0
+            with open(part_file, 'ab' if position else 'wb') as f:
+                for chunk in r.iter_content(self.chunk_size):
+                    f.write(chunk)
+                    h.update(chunk)
+                    written += len(chunk)
+            if length is not None and 'Content-Encoding' not in r.headers and written < int(length):
+                raise requests.ConnectionError(f'connection closed after {position + written} bytes of {url}')
+        return h.hexdigest()
+
+    def download(self, url: str, target_file: str, md5_url: str = None) -> str:
+        """
+        download a file unless target_file already exists and matches the checksum
+        :param url: address of the file
+        :param target_file: location to write the file to
+        :param md5_url: optional address of the checksum of the file
+        :return: target_file
+        """
+        expected = self.md5(md5_url) if md5_url else None
+        if os.path.exists(target_file):
+            if expected is None or file_md5(target_file).hexdigest() == expected:
+                print(f'- {target_file} exists, skipping download')
+                return target_file
+            print(f'- {target_file} does not match {md5_url}, downloading again')
+        part_file = target_file + '.part'
+        start = time.time()
+        print(f'- downloading {url}' + (f' (resuming after {os.path.getsize(part_file)} bytes)' if os.path.exists(part_file) else ''))
+        for attempt in range(self.retries + 1):
+            try:
+                digest = self._fetch(url, part_file)
+                break
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                if attempt == self.retries:
+                    raise
+                print(f'- download of {url} interrupted ({e}), resuming')
+        if expected is not None and digest != expected:
+            os.remove(part_file)
+            raise ValueError(f'checksum of {url} is {digest}, expected {expected} from {md5_url}')
+        os.replace(part_file, target_file)
+        print(f'- finished download {target_file} in {timedelta(seconds=time.time() - start)}'
+              + (' (md5 verified)' if expected is not None else ''))
+        return target_file
+
+    def submit(self, url: str, target_file: str, md5_url: str = None):
+        """
+        download a file in the background
+        :return: future of the location of the downloaded file
+        """
+        return self.executor.submit(self.download, url, target_file, md5_url)
+
+    def close(self) -> None:
+        """
+        wait for the submitted downloads and close the connections
+        """
+        self.executor.shutdown()
+        self.session.close()
@@ -0,0 +1,91 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def save_matrix(matrix_file: str, matrix) -> None:
+    """
+    write embeddings as one contiguous float32 matrix
+    :param matrix_file: location of the .npy file, rows are aligned to the rows of the corresponding table
+    :param matrix: 2d array or list of equally sized embeddings
+    """
+    np.save(matrix_file, np.ascontiguousarray(matrix, dtype=np.float32))
+
+
+def load_matrix(matrix_file: str, mmap: bool = True) -> np.ndarray:
+    """
+    load an embedding matrix written by save_matrix
+    :param matrix_file: location of the .npy file
+    :param mmap: map the file into memory instead of reading it
+    :return: float32 matrix with one embedding per row
+    """
+    return np.load(matrix_file, mmap_mode='r' if mmap else None)
+
+
+def save_embedding_map(map_file: str, keys: list, matrix, dim: int = 300) -> None:
+    """
+    write embeddings of unique strings as a parquet table with a key and a fixed size float32 list column
+    :param map_file: location of the parquet file
+    :param keys: strings the embeddings belong to
+    :param matrix: 2d array or list with one embedding per key
+    :param dim: size of the embeddings
+    """
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32).reshape(len(keys), dim)
+    embedding = pa.FixedSizeListArray.from_arrays(pa.array(matrix.ravel()), dim)
+    pq.write_table(pa.table({'key': pa.array(keys, type=pa.string()), 'embedding': embedding}), map_file)
+
+
+def load_embedding_map(map_file: str) -> tuple:
+    """
+    load an embedding map written by save_embedding_map
+    :param map_file: location of the parquet file
+    :return: list of keys and float32 matrix with one embedding per key
+    """
+    table = pq.read_table(map_file)
+    embedding = table.column('embedding').combine_chunks()
+    matrix = embedding.values.to_numpy(zero_copy_only=False).reshape(len(embedding), embedding.type.list_size)
+    return table.column('key').to_pylist(), matrix
+
+
+def _scale_file(matrix_file: str) -> str:
+    return matrix_file[:-len('.npy')] + '.scale.npy' if matrix_file.endswith('.npy') else matrix_file + '.scale.npy'
+
+
+def quantize(matrix, chunk_size: int = 1 << 16) -> tuple:
+    """
+    quantize embeddings to int8 with one scale per vector, the vector is approximately codes * scale
+    :param matrix: 2d array of embeddings
+    :param chunk_size: number of rows converted at once
+    :return: int8 codes and float32 scales
+    """
+    codes = np.zeros(matrix.shape, dtype=np.int8)
+    scales = np.zeros(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), chunk_size):
+        chunk = np.asarray(matrix[start:start + chunk_size], dtype=np.float32)
+        scale = np.abs(chunk).max(axis=1, initial=0) / 127
+        # zero vectors keep zero codes
+        codes[start:start + chunk_size] = np.rint(chunk / np.where(scale > 0, scale, 1)[:, None]).clip(-127, 127)
+        scales[start:start + chunk_size] = scale
+    return codes, scales
+
+
+def save_quantized_matrix(matrix_file: str, matrix) -> None:
+    """
+    write embeddings as an int8 matrix and a float32 vector of per row scales next to it
+    :param matrix_file: location of the .npy file of the codes, the scales are written to <name>.scale.npy
+    :param matrix: 2d array of embeddings
+    """
+    codes, scales = quantize(matrix)
+    np.save(matrix_file, codes)
+    np.save(_scale_file(matrix_file), scales)
+
+
+def load_quantized_matrix(matrix_file: str, mmap: bool = True) -> tuple:
+    """
+    load a matrix written by save_quantized_matrix
+    :param matrix_file: location of the .npy file of the codes
+    :param mmap: map the files into memory instead of reading them
+    :return: int8 codes and float32 scales
+    """
+    mmap_mode = 'r' if mmap else None
+    return np.load(matrix_file, mmap_mode=mmap_mode), np.load(_scale_file(matrix_file), mmap_mode=mmap_mode)
@@ -0,0 +1,155 @@
+import pandas as pd
+
+RDF_TYPE = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#type'
+RDFS_LABEL = 'http://www.w3.org/2000/01/rdf-schema#label'
+GEO_AS_WKT = 'http://www.opengis.net/ont/geosparql#asWKT'
+
+
+class EntityTableBuilder:
+    """
+    collect candidate and subject rows from a stream of triples
+    produces the same tables as the spatial object and relation queries in generate_entities.py:
+    candidates are entities with a label, a location and one of the relevant classes,
+    subjects are entities with a location and one of the spatial relations.
+    entities are turned into rows as soon as the next subject starts, so the triples of a subject are expected to
+    arrive together, as written by create_triples.py and rdflib.
+    with contiguous=True the geo object of an entity is also expected within the triples of the entity,
+    as written by create_triples.py. otherwise entities whose geo object has not been read yet wait for its location,
+    and locations wait for their entity, which keeps the records of entities that can produce rows only.
+    """
+    def __init__(self, wkgs: str, classes: list, relations: list, contiguous: bool = False):
+        """
+        :param wkgs: uri of the WorldKG schema namespace used in the triples
+        :param classes: class names relevant for candidates, either as uri or as name
+        :param relations: spatial relations in prefix:name form, e.g. wkgs:isInCountry
+        :param contiguous: whether the geo object of an entity arrives within the triples of the entity
+        """
+        # rdflib terms do not compare equal to plain strings, all uris are handled as str
+        wkgs = str(wkgs)
+        self.class_order = {wkgs + c.split('/')[-1]: pos for pos, c in enumerate(classes)}
+        self.relation_order = {wkgs + r.split(':')[-1]: pos for pos, r in enumerate(relations)}
+        self.relation_names = {wkgs + r.split(':')[-1]: r for r in relations}
+        self.spatial_object = wkgs + 'spatialObject'
+        self.name_en = wkgs + 'nameEn'
+        self.contiguous = contiguous
+
+        # position of the current chunk, used to restore input order when tables of several workers are merged
+        self.chunk = 0
+
+        self.records = {}
+        self.wkt = {}
+        self._entity = None
+        self._geo = None
+        # entities waiting for the location of their geo object and geo objects of entities without rows
+        self.pending = {}
+        self.ignored = set()
+
+        self.candidate_rows = []
+        self.subject_rows = []
+
+    def _record(self, s: str) -> dict:
+        record = self.records.get(s)
+        if record is None:
+            record = {'labels': [], 'names_en': [], 'types': [], 'geo': None, 'relations': []}
+            self.records[s] = record
+        return record
+
+    def add(self, triple: tuple) -> None:
+        """
+        consume a triple, same signature as rdflib.Graph.add
+        :param triple: tuple of subject, predicate and object
+        """
+        s, p, o = str(triple[0]), str(triple[1]), str(triple[2])
+        if s != self._entity and s != self._geo:
+            self.flush()
+            self._entity = s
+
+        if p == GEO_AS_WKT:
+            if s in self.pending:
+                self._rows(*self.pending.pop(s), o)
+            elif s in self.ignored:
+                self.ignored.discard(s)
+            else:
+                self.wkt[s] = o
+        elif p == self.spatial_object:
+            self._record(s)['geo'] = o
+            if s == self._entity:
+                self._geo = o
+        elif p == RDF_TYPE:
+            self._record(s)['types'].append(o)
+        elif p == RDFS_LABEL:
+            self._record(s)['labels'].append(o)
+        elif p == self.name_en:
+            self._record(s)['names_en'].append(o)
+        elif p in self.relation_order:
+            self._record(s)['relations'].append((p, o))
+
+    def _rows(self, s: str, record: dict, location: str) -> None:
+        uri = f"wkg:{s.split('/')[-1]}"
+        for t in record['types']:
+            if t in self.class_order:
+                for label in record['labels']:
+                    for name_en in record['names_en'] or ['<UNK>']:
+                        self.candidate_rows.append((self.class_order[t], self.chunk, uri, label, location,
+                                                    t.split('/')[-1], name_en))
+        for p, literal in record['relations']:
+            for t in record['types'] or ['<UNK>']:
+                self.subject_rows.append((self.relation_order[p], self.chunk, uri, self.relation_names[p],
+                                          literal, location, t.split('/')[-1]))
+
+    def _produces_rows(self, record: dict) -> bool:
+        return bool(record['relations']) or (bool(record['labels']) and any(t in self.class_order for t in record['types']))
+
+    def flush(self) -> None:
+        """
+        turn the entities collected since the last flush into rows
+        """
+        for s, record in self.records.items():
+            geo = record['geo']
+            location = self.wkt.pop(geo, None)
+            if location is not None:
+                self._rows(s, record, location)
+            elif not self.contiguous and geo is not None:
+                # the geo object follows later in the file
+                if self._produces_rows(record):
+                    self.pending[geo] = (s, record)
+                else:
+                    self.ignored.add(geo)
+        self.records = {}
+        if self.contiguous:
+            self.wkt = {}
+        self._entity = None
+        self._geo = None
+
+    def frames(self) -> tuple:
+        """
+        :return: unsorted candidate and subject frames including the ordering columns
+        """
+        self.flush()
+        candidates = pd.DataFrame(self.candidate_rows, columns=['_group', '_chunk', 'uri', 'label', 'location', 'type', 'label_en'])
+        subjects = pd.DataFrame(self.subject_rows, columns=['_group', '_chunk', 'uri', 'predicate', 'literal', 'location', 'type'])
+        return candidates, subjects
+
+
+def finalize(frames: list) -> pd.DataFrame:
+    """
+    combine frames of one or more builders and order rows by class or relation, then by input position
+    :param frames: list of frames returned by EntityTableBuilder.frames
+    :return: table without the ordering columns
+    """
+    df = pd.concat(frames, ignore_index=True)
+    df = df.sort_values(['_group', '_chunk'], kind='stable')
+    return df.drop(columns=['_group', '_chunk']).reset_index(drop=True)
+
+
+def read_classes(class_file: str) -> list:
+    return list(pd.read_csv(class_file, header=None, names=['type'])['type'])
+
+
+def read_relations(relation_file: str) -> list:
+    return list(pd.read_csv(relation_file)['relations'])
+
+
+def write_tables(candidates: pd.DataFrame, subjects: pd.DataFrame, candidate_file: str, subject_file: str) -> None:
+    candidates.to_parquet(candidate_file, compression='gzip', engine='pyarrow')
+    subjects.to_parquet(subject_file, compression='gzip', engine='pyarrow')
@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+from gensim.models.fasttext import ft_ngram_hashes, load_facebook_vectors
+
+
+def _source_info(fasttext_file: str) -> dict:
+    stat = os.stat(fasttext_file)
+    return {'file': os.path.abspath(fasttext_file), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def is_compiled(store_dir: str, fasttext_file: str) -> bool:
+    """
+    check whether a store was compiled from the current version of a fasttext binary
+    :param store_dir: directory of the compiled store
+    :param fasttext_file: location of the fasttext binary
+    :return: True if the store exists and matches the binary
+    """
+    meta_file = os.path.join(store_dir, 'meta.json')
+    if not os.path.exists(meta_file):
+        return False
+    with open(meta_file, 'r') as f:
+        return json.load(f)['source'] == _source_info(fasttext_file)
+
+
+def compile_store(fasttext_file: str, store_dir: str) -> None:
+    """
+    convert a facebook fasttext binary into a directory of memory mappable files
+    only the word vectors and the character n-gram buckets are kept, the training state of the model is dropped
+    :param fasttext_file: location of the fasttext binary, e.g. cc.en.300.bin.gz
+    :param store_dir: directory to write the store to
+    """
+    wv = load_facebook_vectors(fasttext_file)
+    os.makedirs(store_dir, exist_ok=True)
+    # meta.json is written last and marks the store as complete
+    if os.path.exists(os.path.join(store_dir, 'meta.json')):
+        os.remove(os.path.join(store_dir, 'meta.json'))
+    np.save(os.path.join(store_dir, 'vectors.npy'), np.ascontiguousarray(wv.vectors, dtype=np.float32))
+    np.save(os.path.join(store_dir, 'vectors_ngrams.npy'), np.ascontiguousarray(wv.vectors_ngrams, dtype=np.float32))
+    with open(os.path.join(store_dir, 'words.txt'), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(wv.index_to_key))
+    meta = {'min_n': wv.min_n, 'max_n': wv.max_n, 'bucket': wv.bucket, 'vector_size': wv.vector_size,
+            'source': _source_info(fasttext_file)}
+    with open(os.path.join(store_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+class FastTextStore:
+    """
+    fasttext word vectors opened from a store written by compile_store
+    supports `word in store` and `store[word]` like the wv attribute of a gensim fasttext model: known words return
+    their vector, unknown words the mean of their character n-gram buckets. the matrices are mapped read only,
+    so processes using the same store share their pages.
+    """
+    def __init__(self, store_dir: str):
+        """
+        :param store_dir: directory of the compiled store
+        """
+        with open(os.path.join(store_dir, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        self.min_n = meta['min_n']
+        self.max_n = meta['max_n']
+        self.bucket = meta['bucket']
+        self.vector_size = meta['vector_size']
+        self.vectors = np.load(os.path.join(store_dir, 'vectors.npy'), mmap_mode='r')
+        self.vectors_ngrams = np.load(os.path.join(store_dir, 'vectors_ngrams.npy'), mmap_mode='r')
+        with open(os.path.join(store_dir, 'words.txt'), 'r', encoding='utf-8', newline='') as f:
+            self.key_to_index = {word: i for i, word in enumerate(f.read().split('\n'))}
+
+    def __contains__(self, word: str) -> bool:
+        # same as gensim, with n-gram buckets every word has a vector
+        if self.bucket == 0:
+            return word in self.key_to_index
+        return True
+
+    def __getitem__(self, word: str) -> np.ndarray:
+        index = self.key_to_index.get(word)
+        if index is not None:
+            return np.array(self.vectors[index])
+        if self.bucket == 0:
+            raise KeyError('cannot calculate vector for OOV word without ngrams')
+        ngram_hashes = ft_ngram_hashes(word, self.min_n, self.max_n, self.bucket)
+        if len(ngram_hashes) == 0:
+            return np.zeros(self.vector_size, dtype=np.float32)
+        # rows are added in order, as in gensim
+        return self.vectors_ngrams[ngram_hashes].sum(axis=0) / len(ngram_hashes)
+
+
+def load_word_vectors(fasttext_file: str):
+    """
+    open fasttext word vectors from a compiled store or a facebook binary
+    :param fasttext_file: store directory or location of the fasttext binary
+    :return: FastTextStore or gensim FastTextKeyedVectors
+    """
+    if os.path.isdir(fasttext_file):
+        return FastTextStore(fasttext_file)
+    return load_facebook_vectors(fasttext_file)
+
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fasttext_file', required=True, type=str, help='location of fasttext binaries')
+    parser.add_argument('--store_dir', type=str, default='data/fasttext_store', help='directory to write the compiled vector store to')
+    parser.add_argument('--force', action='store_true', default=False, help='compile even if the store matches the binary')
+    args = parser.parse_args(argv)
+
+    if not args.force and is_compiled(args.store_dir, args.fasttext_file):
+        print(f'- {args.store_dir} is up to date')
+        return
+    print('Compiling fasttext vector store:')
+    start = time.time()
+    compile_store(args.fasttext_file, args.store_dir)
+    print(f'- wrote {args.store_dir} in {time.time() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
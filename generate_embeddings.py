@@ -1,102 +1,81 @@
 import pandas as pd
 import numpy as np
-import pygeohash
-import re
-import gensim
-import json
 import argparse
+from embedding_store import save_matrix, save_embedding_map, save_quantized_matrix, load_quantized_matrix
+from sentence_embedder import SentenceEmbedder
+from fasttext_store import load_word_vectors
+from geohash_codec import wkt_to_geohash
 
-def wkt_to_geohash(wkt:str, precision:int=6) -> str:
-    """
-    encode string in wkt format to geohash
-    :param wkt: location encoded in wkt format
-    :return: geohash encoded location string
-    """
-    m = re.match(r'Point\((.*) (.*)\)', wkt)
-    if m:
-        lon = float(m.group(1))
-        lat = float(m.group(2))
-        return pygeohash.encode(longitude=lon, latitude=lat, precision=precision)
-    else:
-        return '000000'
 
-def generate_embedding(sentence:str, model:gensim.models.fasttext) -> np.array:
-    """
-    generate average embedding for list of strings
-    :param sentence: string to embed
-    :param model: model to generate embeddings from
-    :return: average embedding of all words
-    """
-    embeddings = []
-    words = sentence.split(' ')  # splitting to avoid parsing as subwords
-    for word in words:
-        if word in model.wv:
-            embeddings.append(model.wv[word])
-        else:
-            embeddings.append(np.zeros(300))
-    return np.mean(embeddings, axis=0).tolist()
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fasttext_file', required=True, type=str, help='location of fasttext binaries or of a vector store compiled with fasttext_store.py')
+    parser.add_argument('--candidate_input', type=str, default='data/candidates.parquet.zip')
+    parser.add_argument('--subject_input', type=str, default='data/subjects.parquet.zip')
+    parser.add_argument('--candidate_output', type=str, default='data/candidates_embedding.parquet.zip')
+    parser.add_argument('--candidate_embeddings', type=str, default='data/candidates_embedding.npy', help='float32 label embeddings aligned to the rows of candidate_output')
+    parser.add_argument('--quantize', action='store_true', default=False, help='also write the label embeddings as int8 with per vector scales')
+    parser.add_argument('--candidate_quantized', type=str, default='data/candidates_embedding.q8.npy', help='int8 label embeddings written with --quantize')
+    parser.add_argument('--subject_output', type=str, default='data/subjects_embedding.parquet.zip')
+    parser.add_argument('--predicate_map', type=str, default='data/predicate_map.parquet')
+    parser.add_argument('--literal_map', type=str, default='data/literal_map.parquet')
+    parser.add_argument('--type_map', type=str, default='data/type_map.parquet')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes used to look up word vectors')
+    parser.add_argument('--batch_size', type=int, default=100000, help='number of labels embedded at once')
+    args = parser.parse_args(argv)
 
-def generate_tail_label_embedding(label:str, name:str, model:gensim.models.fasttext) -> np.array:
-    """
-    wrapper function to conditionally combine label and name embeddings for tail candidates
-    :param label: string containing label
-    :param name: string containing name
-    :param model: fasttext model used to generate embeddings
-    :return: conditionally, average embedding of labels
-    """
-    embedding = generate_embedding(label, model)
-    if name != '<UNK>':
-        embedding = np.mean([embedding, generate_embedding(name, model)], axis=0)
-    return embedding
+    print('Embedding generation starting:')
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--fasttext_file', required=True, type=str, help='location of fasttext binaries')
-parser.add_argument('--candidate_input', type=str, default='data/candidates.parquet.zip')
-parser.add_argument('--subject_input', type=str, default='data/subjects.parquet.zip')
-parser.add_argument('--candidate_output', type=str, default='data/candidates_embedding.parquet.zip')
-parser.add_argument('--subject_output', type=str, default='data/subjects_embedding.parquet.zip')
-parser.add_argument('--predicate_map', type=str, default='data/predicate_map.json')
-parser.add_argument('--literal_map', type=str, default='data/literal_map.json')
-parser.add_argument('--type_map', type=str, default='data/type_map.json')
-args = parser.parse_args()
+    print('- loading fasttext model, this may take a while unless a compiled store is used')
+    word_vectors = load_word_vectors(args.fasttext_file)
+    # every distinct word is looked up once and reused for labels, types, predicates and literals
+    embedder = SentenceEmbedder(word_vectors, workers=args.workers, batch_size=args.batch_size)
 
-print('Embedding generation starting:')
+    print('- generating candidate embeddings')
+    candidates = pd.read_parquet(args.candidate_input)
 
-print('- loading fasttext model, this may take a while')
-ft_model = gensim.models.fasttext.load_facebook_model(args.fasttext_file)
+    # generate geohash encoding for location
+    candidates['geohash'] = wkt_to_geohash(candidates['location'])
+    # generate label embeddings per entry, names are averaged in where available
+    label_emb = embedder.embed(list(candidates['label']), names=list(candidates['label_en']))
+    # generate embeddings for unique types to reduce compuatation cost
+    types = list(candidates['type'].unique())
+    type_emb = embedder.embed(types)
+    type_emb[[t == '<UNK>' for t in types]] = 0
 
-print('- generating candidate embeddings')
-candidates = pd.read_parquet(args.candidate_input)
+    candidates.to_parquet(args.candidate_output, compression='gzip', engine='pyarrow')
+    save_matrix(args.candidate_embeddings, label_emb)
+    if args.quantize:
+        save_quantized_matrix(args.candidate_quantized, label_emb)
+        codes, scales = load_quantized_matrix(args.candidate_quantized, mmap=False)
+        # cosine similarity between the float and the dequantized embeddings of non zero vectors
+        restored = codes.astype(np.float32) * scales[:, None]
+        norms = np.linalg.norm(label_emb, axis=1) * np.linalg.norm(restored, axis=1)
+        agreement = (label_emb * restored).sum(axis=1)[norms > 0] / norms[norms > 0]
+        print(f'- quantized label embeddings: {codes.nbytes / 2**20:.1f} MB instead of {label_emb.nbytes / 2**20:.1f} MB, '
+              f'cosine to float32 mean {agreement.mean() if len(agreement) else 1:.6f} min {agreement.min() if len(agreement) else 1:.6f}')
 
-col_names = list(candidates.columns) + ['geohash'] + [f'label_emb{i}' for i in range(300)]
-# generate geohash encoding for location
-geoh = candidates.apply(lambda row: wkt_to_geohash(row['location']), axis=1)
-# generate label embeddings per entry
-label_emb = candidates.apply(lambda row: generate_tail_label_embedding(row['label'], row['label_en'], ft_model), axis=1, result_type='expand')
-candidates = pd.concat([candidates, geoh, label_emb], axis=1)
-candidates.columns = col_names
-# generate embeddings for unique types to reduce compuatation cost
-type_map = {obj_type: np.zeros(300).tolist() if obj_type == '<UNK>' else generate_embedding(obj_type, ft_model) for obj_type in candidates['type'].unique()}
+    save_embedding_map(args.type_map, types, type_emb)
 
-candidates.to_parquet(args.candidate_output, compression='gzip', engine='pyarrow')
+    print('- generating subject embeddings')
+    subjects = pd.read_parquet(args.subject_input)
 
-with open(args.type_map, 'w') as f:
-    json.dump(type_map, f)
+    # generate geohash encoding for location
+    subjects['geohash'] = wkt_to_geohash(subjects['location'])
+    # generate embeddings for unique predicates to reduce compuatation cost
+    predicates = list(subjects['predicate'].unique())
+    predicate_emb = embedder.embed([pred.split(':')[-1] for pred in predicates])
+    # generate embeddings for unique literals to reduce compuatation cost
+    literals = list(subjects['literal'].unique())
+    literal_emb = embedder.embed(literals)
 
-print('- generating subject embeddings')
-subjects = pd.read_parquet(args.subject_input)
+    subjects.to_parquet(args.subject_output, compression='gzip', engine='pyarrow')
 
-# generate geohash encoding for location
-subjects['geohash'] = subjects.apply(lambda row: wkt_to_geohash(row['location']), axis=1)
-# generate embeddings for unique predicates to reduce compuatation cost
-predicate_map = {pred: generate_embedding(pred.split(':')[-1], ft_model) for pred in subjects['predicate'].unique()}
-# generate embeddings for unique literals to reduce compuatation cost
-literal_map = {literal: generate_embedding(literal, ft_model) for literal in subjects['literal'].unique()}
+    save_embedding_map(args.predicate_map, predicates, predicate_emb)
+    save_embedding_map(args.literal_map, literals, literal_emb)
 
-subjects.to_parquet(args.subject_output, compression='gzip', engine='pyarrow')
+    print(f'- embedded {len(candidates) + len(literals)} labels and literals with {len(embedder.words)} distinct words')
 
-with open(args.predicate_map, 'w') as f:
-    json.dump(predicate_map, f)
 
-with open(args.literal_map, 'w') as f:
-    json.dump(literal_map, f)
+if __name__ == '__main__':
+    main()
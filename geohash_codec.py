@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# mean earth radius in km, as used by the haversine package
+EARTH_RADIUS = 6371.0088
+
+_CHARS = np.array(list(BASE32))
+_VALUES = np.full(256, -1, dtype=np.int16)
+_VALUES[np.frombuffer(BASE32.encode('ascii'), dtype=np.uint8)] = np.arange(32)
+
+
+def encode(latitude, longitude, precision: int = 6) -> np.ndarray:
+    """
+    encode locations to geohashes, gives the same result as pygeohash.encode of pygeohash 1.2.0
+    :param latitude: array of latitudes
+    :param longitude: array of longitudes
+    :return: array of geohash strings
+    """
+    latitude = np.asarray(latitude, dtype=np.float64)
+    longitude = np.asarray(longitude, dtype=np.float64)
+    intervals = {False: [np.full(latitude.shape, -90.0), np.full(latitude.shape, 90.0)],
+                 True: [np.full(longitude.shape, -180.0), np.full(longitude.shape, 180.0)]}
+    values = {False: latitude, True: longitude}
+    codes = np.zeros(latitude.shape + (precision,), dtype=np.uint8)
+    # bits alternate between longitude and latitude, starting with longitude
+    for bit in range(precision * 5):
+        is_lon = bit % 2 == 0
+        low, high = intervals[is_lon]
+        mid = (low + high) / 2
+        # points on the border of two cells belong to the lower one, like in pygeohash
+        upper = values[is_lon] > mid
+        intervals[is_lon] = [np.where(upper, mid, low), np.where(upper, high, mid)]
+        codes[..., bit // 5] = (codes[..., bit // 5] << 1) | upper
+    return np.ascontiguousarray(_CHARS[codes]).view(f'<U{precision}')[..., 0]
+
+
+def decode(geohashes) -> tuple:
+    """
+    decode geohashes of equal length to the centers of their cells, same as pygeohash.decode_exactly(h)[:2]
+    :param geohashes: array of geohash strings
+    :return: arrays of latitudes and longitudes
+    """
+    geohashes = np.asarray(geohashes, dtype=str)
+    if geohashes.size == 0:
+        return np.zeros(geohashes.shape), np.zeros(geohashes.shape)
+    precision = geohashes.dtype.itemsize // 4
+    # shorter geohashes are padded with null characters, which are not valid base32 characters
+    codes = _VALUES[np.char.lower(geohashes).view(np.uint32).reshape(geohashes.shape + (precision,)).clip(0, 255)]
+    if (codes < 0).any():
+        raise ValueError('geohashes must be of equal length and only contain base32 characters')
+    intervals = {False: [np.full(geohashes.shape, -90.0), np.full(geohashes.shape, 90.0)],
+                 True: [np.full(geohashes.shape, -180.0), np.full(geohashes.shape, 180.0)]}
+    for bit in range(precision * 5):
+        is_lon = bit % 2 == 0
+        low, high = intervals[is_lon]
+        mid = (low + high) / 2
+        upper = ((codes[..., bit // 5] >> (4 - bit % 5)) & 1) == 1
+        intervals[is_lon] = [np.where(upper, mid, low), np.where(upper, high, mid)]
+    return (intervals[False][0] + intervals[False][1]) / 2, (intervals[True][0] + intervals[True][1]) / 2
+
+
+def haversine(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    haversine distance between locations in km, arrays are broadcast against each other
+    :param lat1: latitudes of the first locations
+    :param lon1: longitudes of the first locations
+    :param lat2: latitudes of the second locations
+    :param lon2: longitudes of the second locations
+    :return: array of distances
+    """
+    lat1, lon1, lat2, lon2 = np.radians(lat1), np.radians(lon1), np.radians(lat2), np.radians(lon2)
+    d = np.sin((lat2 - lat1) * 0.5) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) * 0.5) ** 2
+    return EARTH_RADIUS * (2 * np.arcsin(np.sqrt(d)))
+
+
+def distance_matrix(geohashes1, geohashes2) -> np.ndarray:
+    """
+    distances between the cell centers of two lists of geohashes
+    :param geohashes1: geohashes of the rows
+    :param geohashes2: geohashes of the columns
+    :return: matrix of distances in km
+    """
+    lat1, lon1 = decode(geohashes1)
+    lat2, lon2 = decode(geohashes2)
+    return haversine(lat1[:, None], lon1[:, None], lat2[None, :], lon2[None, :])
+
+
+def wkt_to_geohash(wkts, precision: int = 6) -> np.ndarray:
+    """
+    encode points in wkt format to geohashes
+    :param wkts: list of locations encoded in wkt format
+    :param precision: length of the geohashes
+    :return: array of geohashes, '000000' for locations that are not points
+    """
+    points = pd.Series(wkts, dtype=object).str.extract(r'^Point\((.*) (.*)\)')
+    is_point = points[0].notna().to_numpy()
+    geohashes = np.full(len(points), '0' * precision, dtype=f'<U{precision}')
+    geohashes[is_point] = encode(points[1][is_point].astype(float).to_numpy(), points[0][is_point].astype(float).to_numpy(), precision)
+    return geohashes
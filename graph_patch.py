@@ -0,0 +1,162 @@
+import re
+import pandas as pd
+from rdflib import URIRef, Literal
+from triple_writer import TurtleLineWriter, SAFE_LOCAL
+from turtle_stream import TurtleReader, TOKEN, _unescape
+
+# a statement written by TurtleLineWriter: subject, predicate and a single object on one line
+FLAT_TRIPLE = re.compile(r'^(\S+) (\S+) (.+) \.\n?$')
+
+
+class NotFlat(Exception):
+    """
+    raised when a file is not written with one triple per line
+    """
+
+
+def load_predictions(prediction_file: str, namespaces: dict, cut_off: float = 1.5) -> dict:
+    """
+    read the predictions with a score above cut_off
+    :param prediction_file: tab separated file written by match_entities.py
+    :param namespaces: dictionary mapping prefixes to namespace uris
+    :param cut_off: minimum score for a prediction to be accepted
+    :return: dictionary of (subject uri, predicate uri, literal) -> list of predicted object uris
+    """
+    def expand(term: str) -> str:
+        prefix, local = term.split(':', 1)
+        return namespaces[prefix] + local if prefix in namespaces else term
+
+    predictions = pd.read_csv(prediction_file, sep='\t', skip_blank_lines=True, keep_default_na=False,
+                              dtype={'s': str, 'p': str, 'o': str, 'literal': str})
+    predictions = predictions[predictions['score'].astype(float) > cut_off]
+    accepted = {}
+    for s, p, o, literal in zip(predictions['s'], predictions['p'], predictions['o'], predictions['literal']):
+        objects = accepted.setdefault((expand(s), expand(p), literal), [])
+        if expand(o) not in objects:
+            objects.append(expand(o))
+    return accepted
+
+
+def _patch_lines(graph_file: str, output_file: str, accepted: dict, namespaces: dict, buffer_size: int) -> tuple:
+    """
+    copy a flat turtle file line by line, only lines starting with the subject and predicate of a prediction are parsed
+    :return: keys of the predictions that replaced a literal and the uri triples written for their subjects and predicates
+    """
+    uris = {uri: prefix for prefix, uri in namespaces.items()}
+
+    def expand(token: str) -> str:
+        if token.startswith('<'):
+            return _unescape(token[1:-1])
+        prefix, local = token.split(':', 1)
+        return namespaces[prefix] + _unescape(local) if prefix in namespaces else token
+
+    def contract(uri: str) -> str:
+        split = max(uri.rfind('/'), uri.rfind('#')) + 1
+        prefix = uris.get(uri[:split])
+        if prefix is not None and SAFE_LOCAL.match(uri[split:]):
+            return f'{prefix}:{uri[split:]}'
+        return f'<{uri}>'
+
+    # subjects and predicates of predictions as they can be written in the file
+    pairs = set()
+    for s, p, _ in accepted:
+        for s_token in {contract(s), f'<{s}>'}:
+            for p_token in {contract(p), f'<{p}>'}:
+                pairs.add((s_token.encode('utf-8'), p_token.encode('utf-8')))
+
+    replaced = set()
+    # like in an rdflib graph, a triple with a uri object is written once, whether it is predicted or in the file
+    emitted = set()
+    with open(graph_file, 'rb') as source, open(output_file, 'wb', buffering=buffer_size) as target:
+        for line in source:
+            # statements spanning several lines as written by rdflib
+            if line.endswith((b' ;\n', b' ,\n')):
+                raise NotFlat(line)
+            parts = line.split(b' ', 2)
+            if len(parts) == 3 and (parts[0], parts[1]) in pairs:
+                text = line.decode('utf-8')
+                m = FLAT_TRIPLE.match(text)
+                term = TOKEN.match(m.group(3)) if m else None
+                if term is None or term.end() != len(m.group(3)):
+                    raise NotFlat(line)
+                if term.lastgroup in ('iri', 'pname'):
+                    triple = (expand(m.group(1)), expand(m.group(2)), expand(m.group(3)))
+                    if triple in emitted:
+                        continue
+                    emitted.add(triple)
+                # plain literals are the only objects that can be replaced
+                string = term.group('string') if term.lastgroup == 'literal' and term.group('lang') is None and term.group('datatype') is None else None
+                if string is not None and not string.startswith(('"""', "'''")):
+                    key = (expand(m.group(1)), expand(m.group(2)), _unescape(string[1:-1]))
+                    objects = accepted.get(key)
+                    if objects is not None:
+                        replaced.add(key)
+                        for o in objects:
+                            if (key[0], key[1], o) not in emitted:
+                                emitted.add((key[0], key[1], o))
+                                target.write(f'{m.group(1)} {m.group(2)} {contract(o)} .\n'.encode('utf-8'))
+                        continue
+            target.write(line)
+    return replaced, emitted
+
+
+def _patch_triples(graph_file: str, output_file: str, accepted: dict, namespaces: dict, buffer_size: int) -> tuple:
+    """
+    parse any turtle file with TurtleReader and write it as flat turtle
+    :return: keys of the predictions that replaced a literal and the uri triples written for their subjects and predicates
+    """
+    pairs = {(s, p) for s, p, _ in accepted}
+    replaced = set()
+    emitted = set()
+    writer = TurtleLineWriter(output_file, namespaces, buffer_size=buffer_size)
+    for s, p, o in TurtleReader(graph_file):
+        if isinstance(o, Literal) and o.datatype is None and o.language is None:
+            key = (str(s), str(p), str(o))
+            objects = accepted.get(key)
+            if objects is not None:
+                replaced.add(key)
+                for uri in objects:
+                    if (key[0], key[1], uri) not in emitted:
+                        emitted.add((key[0], key[1], uri))
+                        writer.add((s, p, URIRef(uri)))
+                continue
+        elif isinstance(o, URIRef) and (str(s), str(p)) in pairs:
+            if (str(s), str(p), str(o)) in emitted:
+                continue
+            emitted.add((str(s), str(p), str(o)))
+        writer.add((s, p, o))
+    writer.close()
+    return replaced, emitted
+
+
+def patch_graph(graph_file: str, output_file: str, accepted: dict, namespaces: dict, buffer_size: int = 1 << 20) -> tuple:
+    """
+    replace literal objects by predicted uris while streaming a turtle file
+    files written with one triple per line, like the graph of create_triples.py, are copied line by line. other turtle
+    files are parsed and written as flat turtle. like the rdflib update, predictions whose literal is not in the graph
+    are added as new triples at the end, and triples of the predicted subjects and predicates are not written twice.
+    :param graph_file: turtle file to patch
+    :param output_file: location of the patched file
+    :param accepted: predictions returned by load_predictions
+    :param namespaces: dictionary mapping prefixes to namespace uris of the graph
+    :param buffer_size: size of the write buffer in bytes
+    :return: number of replaced literals and number of added triples
+    """
+    try:
+        replaced, emitted = _patch_lines(graph_file, output_file, accepted, namespaces, buffer_size)
+    except NotFlat:
+        replaced, emitted = _patch_triples(graph_file, output_file, accepted, namespaces, buffer_size)
+
+    missing = []
+    for key, objects in accepted.items():
+        if key not in replaced:
+            for o in objects:
+                if (key[0], key[1], o) not in emitted:
+                    emitted.add((key[0], key[1], o))
+                    missing.append((key[0], key[1], o))
+    if missing:
+        writer = TurtleLineWriter(output_file, namespaces, buffer_size=buffer_size, append=True)
+        for s, p, o in missing:
+            writer.add((URIRef(s), URIRef(p), URIRef(o)))
+        writer.close()
+    return len(replaced), len(missing)
@@ -1,15 +1,16 @@
 import time
 from datetime import timedelta
 import re
-import shutil
-import io
 import argparse
 import os
+from concurrent.futures import ThreadPoolExecutor
+from ttl_io import read_header, replace_prefix_uris, copy_body
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--input_directory', required=True, type=str, help='location of ttl files')
 parser.add_argument('--replacement_pairs', nargs='+', type=str, help='list of prefixes to replace. Input as prefix=replacement')
 parser.add_argument('--output_file', type=str, required=True, help='Target file for storing resulting ttl files.')
+parser.add_argument('--workers', type=int, default=8, help='number of files whose prefixes are read concurrently')
 args = parser.parse_args()
 
 
@@ -32,48 +33,28 @@ for s in os.listdir(args.input_directory):
 prefixes = []
 prefix_ends = {}
 
-# read unique prefixes and find end of prefix enumeration
+# read unique prefixes and find end of prefix enumeration, only the headers are read
 print('- reading prefixes')
-for f in files:
-    with open(f, 'r') as file:
-        line = next(file)
-        pos = 0
-        while re.match(r'^@prefix.*', line):
-            if line.strip() not in prefixes:
-                prefixes.append(line.strip())
-            pos += 1
-            try:
-                line = next(file)
-            except StopIteration:
-                break
-    prefix_ends.update({f: pos})
+with ThreadPoolExecutor(max(1, args.workers)) as pool:
+    headers = list(pool.map(read_header, files))
+for f, (file_prefixes, offset) in zip(files, headers):
+    for prefix in file_prefixes:
+        if prefix not in prefixes:
+            prefixes.append(prefix)
+    prefix_ends.update({f: offset})
 
 if replacements:
     print('- replacing specified prefixes')
-    for pos, prefix in enumerate(prefixes):
-        parts = prefix.split(' ')
-        if parts[1][:-1] in replacements:
-            parts[2] = f'<{replacements[parts[1][:-1]]}>'
-            prefixes[pos] = ' '.join(parts)
+    prefixes = replace_prefix_uris(prefixes, replacements)
 
-# do file writing with copyfileobj
-# testing showed using this method halves the runtime
 with open(args.output_file, 'wb') as target:
     # write list of prefixes
     print(f'- writing prefixes')
-    for prefix in prefixes:
-        prefix += '\n'
-        b = prefix.encode()
-        p_encoded = io.BytesIO(b)
-        shutil.copyfileobj(p_encoded, target)
-    # concatenate data
+    target.write(''.join(prefix + '\n' for prefix in prefixes).encode())
+    # concatenate data, the bodies are copied from the end of their header without reading them into memory
     for pos, f in enumerate(files):
         print(f'- concatenating {f}')
-        start_line = prefix_ends[f]
-        with open(f, 'rb') as source:
-            lines = source.readlines()
-            b = io.BytesIO(b''.join(lines[start_line:]))
-            shutil.copyfileobj(b, target)
+        copy_body(f, prefix_ends[f], target)
 
 
 end = time.time()
@@ -0,0 +1,124 @@
+import hashlib
+import sqlite3
+import time
+import numpy as np
+import pandas as pd
+
+# changes of the scoring invalidate all entries
+SCORING_VERSION = 'uslp-1'
+
+
+def candidate_fingerprint(candidates: pd.DataFrame, candidate_embeddings: np.ndarray, normalization: dict = None,
+                          geohash_precision: dict = None, embedding_maps: list = (), chunk_size: int = 1 << 16) -> str:
+    """
+    fingerprint of everything a match depends on besides the key: uri, type, geohash and label embedding of every
+    candidate, the largest distance the closeness of every precision is normalized with, which depends on the subjects,
+    the geohash precision of every predicate and the embeddings of literals, types and predicates. the embeddings also
+    change with the fasttext model and with quantization
+    :param candidates: candidate table
+    :param candidate_embeddings: label embeddings aligned to the candidate table
+    :param normalization: precision -> largest distance between subject and candidate cells
+    :param geohash_precision: predicate -> geohash precision
+    :param embedding_maps: list of (keys, embeddings) tuples of the literal, type and predicate maps
+    :param chunk_size: number of rows hashed at once
+    :return: hex digest
+    """
+    digest = hashlib.blake2b(SCORING_VERSION.encode('utf-8'), digest_size=16)
+    for column in ['uri', 'type', 'geohash']:
+        digest.update('\n'.join(candidates[column].astype(str)).encode('utf-8'))
+    # quantized embeddings give different scores than float embeddings
+    digest.update(str(candidate_embeddings.dtype).encode('utf-8'))
+    for start in range(0, len(candidate_embeddings), chunk_size):
+        digest.update(np.ascontiguousarray(candidate_embeddings[start:start + chunk_size]).tobytes())
+    # repr keeps every digit of the float maxima
+    digest.update(repr(sorted((int(p), float(m)) for p, m in (normalization or {}).items())).encode('utf-8'))
+    digest.update(repr(sorted((geohash_precision or {}).items())).encode('utf-8'))
+    for keys, embeddings in embedding_maps:
+        digest.update('\n'.join(str(key) for key in keys).encode('utf-8'))
+        digest.update(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+
+class MatchCache:
+    """
+    best candidate and score per (geohash, predicate, literal) kept across runs in a sqlite database
+    entries are stored with the fingerprint of the candidates and scoring inputs they were computed for, so runs of
+    different countries or of changed extracts can share a database without reading each others matches, also from
+    concurrent processes.
+    entries that were not used recently are removed when the database holds more than max_entries.
+    """
+    def __init__(self, cache_file: str, fingerprint: str, max_entries: int = 10000000, timeout: float = 600):
+        """
+        :param cache_file: location of the sqlite database, created if it does not exist
+        :param fingerprint: fingerprint of the candidates and scoring inputs, see candidate_fingerprint
+        :param max_entries: maximum number of entries kept in the database
+        :param timeout: seconds to wait for other processes writing to the database
+        """
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self.stamp = time.time()
+        self.hits = 0
+        self.misses = 0
+        # transactions take the write lock when they begin, a deferred transaction reading before it writes fails
+        # without waiting if another process wrote in between
+        self.connection = sqlite3.connect(cache_file, timeout=timeout, isolation_level='IMMEDIATE')
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS matches (fingerprint TEXT, geohash TEXT, predicate TEXT, '
+                                'literal TEXT, candidate TEXT, score REAL, used REAL, '
+                                'PRIMARY KEY (fingerprint, predicate, geohash, literal)) WITHOUT ROWID')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS matches_used ON matches (used)')
+        self.connection.execute('CREATE TEMP TABLE lookup (position INTEGER, geohash TEXT, literal TEXT)')
+
+    def get(self, predicate: str, geohashes: list, literals: list) -> tuple:
+        """
+        look up the matches of constellations of a predicate and mark them as used
+        :param predicate: name of the predicate
+        :param geohashes: geohash prefix of every constellation
+        :param literals: literal of every constellation
+        :return: mask of found constellations, their candidate uris and scores
+        """
+        with self.connection:
+            self.connection.executemany('INSERT INTO lookup VALUES (?, ?, ?)', zip(range(len(geohashes)), geohashes, literals))
+            rows = self.connection.execute('SELECT l.position, m.candidate, m.score FROM lookup l JOIN matches m '
+                                           'ON m.fingerprint = ? AND m.predicate = ? AND m.geohash = l.geohash AND m.literal = l.literal',
+                                           (self.fingerprint, predicate)).fetchall()
+            self.connection.execute('UPDATE matches SET used = ? WHERE fingerprint = ? AND predicate = ? AND (geohash, literal) IN '
+                                    '(SELECT geohash, literal FROM lookup)', (self.stamp, self.fingerprint, predicate))
+            self.connection.execute('DELETE FROM lookup')
+
+        found = np.zeros(len(geohashes), dtype=bool)
+        uris = np.empty(len(geohashes), dtype=object)
+        scores = np.zeros(len(geohashes), dtype=np.float64)
+        for position, uri, score in rows:
+            found[position] = True
+            uris[position] = uri
+            scores[position] = score
+        self.hits += len(rows)
+        self.misses += len(geohashes) - len(rows)
+        return found, uris, scores
+
+    def put(self, predicate: str, geohashes: list, literals: list, uris: list, scores: list) -> None:
+        """
+        store the matches of constellations of a predicate
+        :param predicate: name of the predicate
+        :param geohashes: geohash prefix of every constellation
+        :param literals: literal of every constellation
+        :param uris: uri of the best candidate of every constellation
+        :param scores: score of the best candidate of every constellation
+        """
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                        ((self.fingerprint, gh, predicate, lit, uri, float(score), self.stamp)
+                                         for gh, lit, uri, score in zip(geohashes, literals, uris, scores)))
+
+    def close(self) -> None:
+        """
+        evict the least recently used entries above max_entries and close the database
+        """
+        with self.connection:
+            excess = self.connection.execute('SELECT COUNT(*) FROM matches').fetchone()[0] - self.max_entries
+            if excess > 0:
+                self.connection.execute('DELETE FROM matches WHERE (fingerprint, predicate, geohash, literal) IN '
+                                        '(SELECT fingerprint, predicate, geohash, literal FROM matches ORDER BY used LIMIT ?)', (excess,))
+        self.connection.close()
@@ -0,0 +1,151 @@
+import csv
+import json
+import os
+import numpy as np
+
+# best candidate and score of a scored constellation, appended to the memo file
+MEMO_RECORD = np.dtype([('best', '<i8'), ('score', '<f8')])
+
+
+class CheckpointWriter:
+    """
+    write matches in batches together with a journal of the progress
+    the journal records the predicate being matched, the number of its distinct constellations that were scored, the
+    number of its subjects that were written and the size of the output file. scores of the current predicate are
+    appended to a memo file. output and memo are synced to disk before the journal is replaced, so after a crash both
+    files can be truncated to the state of the journal and matching continues without scoring or writing rows twice.
+    """
+    def __init__(self, output_file: str, header: list = None, resume: bool = False, batch_size: int = 10000):
+        """
+        :param output_file: tab separated file the matches are written to
+        :param header: row written to a new output file, no file is created if None
+        :param resume: continue from the journal of the output file if it exists
+        :param batch_size: number of rows written at once
+        """
+        self.output_file = output_file
+        self.journal_file = output_file + '.journal.json'
+        self.memo_file = output_file + '.memo'
+        self.batch_size = batch_size
+        self.rows = []
+
+        self.resumed = resume and os.path.exists(self.journal_file)
+        if self.resumed:
+            with open(self.journal_file, 'r') as f:
+                self.journal = json.load(f)
+            # drop everything written after the last checkpoint
+            os.truncate(self.output_file, self.journal['offset'])
+            if os.path.exists(self.memo_file):
+                os.truncate(self.memo_file, self.journal['scored'] * MEMO_RECORD.itemsize)
+        else:
+            self.journal = {'relation': 0, 'predicate': None, 'scored': 0, 'written': 0, 'offset': 0,
+                            'evaluated': 0, 'computed': 0}
+            if header is not None:
+                open(self.output_file, 'w').close()
+            open(self.memo_file, 'w').close()
+
+        self.file = open(self.output_file, 'a', encoding='utf-8', newline='')
+        self.writer = csv.writer(self.file, delimiter='\t')
+        self.memo_writer = open(self.memo_file, 'ab')
+        if not self.resumed and header is not None:
+            self.writer.writerow(header)
+        self.checkpoint()
+
+    @property
+    def relation(self) -> int:
+        """
+        :return: position of the predicate being matched
+        """
+        return self.journal['relation']
+
+    @property
+    def scored(self) -> int:
+        """
+        :return: number of constellations of the current predicate in the memo
+        """
+        return self.journal['scored']
+
+    @property
+    def written(self) -> int:
+        """
+        :return: number of subjects of the current predicate in the output file
+        """
+        return self.journal['written'] + len(self.rows)
+
+    def checkpoint(self) -> None:
+        """
+        write pending rows, sync output and memo and atomically replace the journal
+        """
+        if self.rows:
+            self.writer.writerows(self.rows)
+            self.journal['written'] += len(self.rows)
+            self.rows = []
+        for file in (self.file, self.memo_writer):
+            file.flush()
+            os.fsync(file.fileno())
+        self.journal['offset'] = os.fstat(self.file.fileno()).st_size
+        with open(self.journal_file + '.tmp', 'w') as f:
+            json.dump(self.journal, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.journal_file + '.tmp', self.journal_file)
+
+    def start_relation(self, relation: int, predicate: str) -> None:
+        """
+        move on to a predicate, keeps the progress if it is the predicate of the journal
+        :param relation: position of the predicate
+        :param predicate: name of the predicate
+        """
+        if relation == self.journal['relation'] and predicate == self.journal['predicate']:
+            return
+        if relation == self.journal['relation'] and self.journal['predicate'] is not None:
+            raise ValueError(f"journal {self.journal_file} was written for {self.journal['predicate']}, not {predicate}")
+        self.checkpoint()
+        self.memo_writer.truncate(0)
+        self.journal.update({'relation': relation, 'predicate': predicate, 'scored': 0, 'written': 0})
+        self.checkpoint()
+
+    def add_scores(self, best: np.ndarray, scores: np.ndarray, evaluated: int = 0, computed: int = 0) -> None:
+        """
+        append the scores of the next constellations of the current predicate to the memo
+        :param best: position of the best candidate per constellation
+        :param scores: score of the best candidate per constellation
+        :param evaluated: number of candidate scores evaluated
+        :param computed: number of literal similarities computed
+        """
+        records = np.zeros(len(best), dtype=MEMO_RECORD)
+        records['best'] = best
+        records['score'] = scores
+        self.memo_writer.write(records.tobytes())
+        self.journal['scored'] += len(best)
+        self.journal['evaluated'] += int(evaluated)
+        self.journal['computed'] += int(computed)
+        self.checkpoint()
+
+    def memo(self) -> tuple:
+        """
+        :return: best candidates and scores of the constellations of the current predicate scored so far
+        """
+        self.memo_writer.flush()
+        records = np.fromfile(self.memo_file, dtype=MEMO_RECORD, count=self.journal['scored'])
+        return records['best'], records['score']
+
+    def write(self, rows) -> None:
+        """
+        add rows of the current predicate, rows are written and checkpointed in batches
+        :param rows: iterable of rows
+        """
+        for row in rows:
+            self.rows.append(row)
+            if len(self.rows) >= self.batch_size:
+                self.checkpoint()
+
+    def close(self) -> None:
+        """
+        write pending rows, close the files and remove journal and memo, the output is complete
+        an interrupted run does not get here and keeps both for resuming
+        """
+        self.checkpoint()
+        self.file.close()
+        self.memo_writer.close()
+        os.remove(self.memo_file)
+        os.remove(self.journal_file)
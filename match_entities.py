@@ -1,188 +1,279 @@
 import json
 import pandas as pd
-from haversine import haversine
-from pygeohash import decode_exactly
 from tqdm import tqdm
 from sklearn.metrics.pairwise import cosine_similarity
 import argparse
-import re
-import csv
-from queue import Queue
-from threading import Thread
+import multiprocessing
+import numpy as np
+from embedding_store import load_matrix, load_embedding_map, load_quantized_matrix
+from uslp_scoring import USLPScorer, LiteralSimilarity
+from geohash_codec import distance_matrix
+from match_checkpoint import CheckpointWriter
+from match_cache import MatchCache, candidate_fingerprint
+from relation_types import TypeIndex, load_relation_types
 
-def haversine_from_geohash(hash1:str, hash2:str) -> float:
-    """
-    function to estimate haversine distance from geohash strings
-    :param hash1: first loaction encoded in geohash
-    :param hash2: second location encoded in geohash
-    :return: estimated distance between locations in km
-    """
-    # only take first two parts of tuples, rest are error estimations
-    hd = haversine(decode_exactly(hash1)[:2], decode_exactly(hash2)[:2])
-    return hd
-
-
-parser = argparse.ArgumentParser()
-parser.add_argument('--candidate_file', type=str, default='data/candidates_embedding.parquet.zip')
-parser.add_argument('--subject_file', type=str, default='data/subjects_embedding.parquet.zip')
-parser.add_argument('--output_file', type=str, default='data/uslp-triplets.csv')
-parser.add_argument('--geohash_precision', type=str, default='required files/geohash_precision.json')
-parser.add_argument('--predicate_map', type=str, default='data/predicate_map.json')
-parser.add_argument('--literal_map', type=str, default='data/literal_map.json')
-parser.add_argument('--type_map', type=str, default='data/type_map.json')
-parser.add_argument('--start_value', type=int, default=0, help='number of predicates to skip, useful for testing or restarts')
-
-args = parser.parse_args()
-
-print('Matching entities:')
-
-candidates = pd.read_parquet(args.candidate_file)
-subjects = pd.read_parquet(args.subject_file)
-
-# precisions to use when comparing distances
-with open(args.geohash_precision, 'r') as f:
-    geohash_precision_map = json.load(f)
-
-with open(args.predicate_map, 'r') as f:
-    predicate_map = json.load(f)
-with open(args.literal_map, 'r') as f:
-    literal_map = json.load(f)
-with open(args.type_map, 'r') as f:
-    type_map = json.load(f)
-
-predicates = pd.DataFrame.from_dict(predicate_map, orient='index')
-literals = pd.DataFrame.from_dict(literal_map, orient='index')
-types = pd.DataFrame.from_dict(type_map, orient='index')
-
-print('- computing similarity scores')
-# cosine similarity matrix for similarity between literals and names
-cos_sim_literal = cosine_similarity(candidates.loc[:, [f'label_emb{i}' for i in range(300)]], literals.values)
-literal_cossim_df = pd.DataFrame(cos_sim_literal, index=candidates.index.to_list(), columns=literals.index)
-
-# cosine similarity matrix for similarity between predicates and types
-cos_sim_predicate = cosine_similarity(types.values, predicates.values)
-predicate_cossim_df = pd.DataFrame(cos_sim_predicate, index=types.index, columns=predicates.index)
-
-# introduce preselection step.
-# need to group heads by predicate types
-# find possible candidate types by type if contained in predicate
-
-# precompute containment of candidate types in predicates
-contains_map = {}
-for predicate in tqdm(predicate_map.keys(), desc='- Computing type containment'):
-    similarities = {}
-    for t in type_map.keys():
-        similarity = 0
-        if t != '<UNK>':
-            if str(t) in predicate:
-                similarity = 0.5
-        similarities.update({t: similarity})
-    contains_map.update({predicate: similarities})
-type_contained = pd.DataFrame.from_dict(contains_map, orient='index')
-
-
-print('- the following distance matrices will be used')
-for precision in set(geohash_precision_map.values()):
-    print(f"- distance matrix prec = {precision}: ({len(candidates.apply(lambda row: row['geohash'][:precision], axis=1).unique())}, {len(subjects.apply(lambda row: row['geohash'][:precision], axis=1).unique())})")
-
-# precompute distances for faster access
-distance_matrices = {}
-for p in tqdm(set(geohash_precision_map.values()), desc='- Computing distance matrices'):
-    # compute distances between unique hash value combinations
-    dist_mat = {hash1: {hash2: haversine_from_geohash(hash1, hash2) for hash2 in candidates.apply(lambda row: row['geohash'][:p], axis=1).unique()} for hash1 in subjects.apply(lambda row: row['geohash'][:p], axis=1).unique()}
-    # pass into dataframe and normalize
-    distance_frame = pd.DataFrame.from_dict(dist_mat, orient='index')
-    max_val = distance_frame.values.max()
-    if max_val > 0:
-        distance_frame = pd.DataFrame(1 - (distance_frame.values / max_val), columns=distance_frame.columns, index=distance_frame.index)
-    distance_matrices.update({p: distance_frame})
-
-def consume(stop, queue, filename) -> None:
+# scoring state used by score_unit, set by main before the workers are forked so they inherit it
+scorer = None
+literal_similarity = None
+candidate_selections = {}
+
+
+def score_unit(unit: tuple) -> tuple:
     """
-    consumer function for threaded file writing
-    :param stop: function to define stop condition
-    :param queue: queue to read content from
-    :param filename: filename to write to
-    :return:
+    score a chunk of subjects of one predicate, in worker processes the matrices are inherited from the parent
+    :param unit: precision, predicate code, key of the candidate selection and preference, cell codes and literal codes
+                 of the subjects
+    :return: best candidates, their scores, number of evaluated scores and number of computed literals
     """
-    with open(filename, 'a', encoding='utf-8', newline='') as file:
-        writer = csv.writer(file, delimiter='\t')
-        while True:
-            if not queue.empty():
-                i = queue.get()
-                writer.writerow(i)
-            elif stop():
-                print('-stopping file writing thread')
-                return
-
-queue = Queue()
-stop_thread = False
-
-# if not a restart, empty or create output file
-if args.start_value == 0:
-    with open(args.output_file, 'w', encoding='utf-8', newline='') as file:
-        queue.put(['s', 'p', 'literal', 'o', 'score'])
-else:
-    print(f'- skinpping first {args.start_value} predicates:')
-    print(f"- {list(subjects['predicate'].value_counts().index[:args.start_value])}")
-
-# consumer for writing training data
-match_consumer = Thread(target=consume, daemon=True, args=(lambda: stop_thread, queue, args.output_file))
-match_consumer.start()
-
-matched = {}
-pbar = tqdm(subjects['predicate'].value_counts().index[args.start_value:], desc='Matching by predicate:')
-for relation in pbar:
-    pbar.set_postfix_str(f'{relation}')
-    selected_subjects = subjects[subjects['predicate'] == relation]
-    selected_candidates = candidates
-
-    # prefilter for faster runtime
-    if re.match(r'.*Country$', relation, re.IGNORECASE):
-        pbar.write(f'- restricting candidates for {relation}')
-        selected_candidates = candidates[candidates['type'] == 'Country']
-    elif re.match(r'.*County$', relation, re.IGNORECASE):
-        pbar.write(f'- restricting candidates for {relation}')
-        selected_candidates = candidates[candidates['type'] == 'County']
-
-    if len(selected_candidates) == 0:
-        pbar.write(f'- no candidates for {relation}: skipping')
+    precision, predicate, key, cells, literals = unit
+    selected, preferred = candidate_selections[key]
+    evaluated, computed = scorer.evaluated, literal_similarity.computed
+    best, scores = scorer.score(precision, predicate, cells, literals, selected, preferred)
+    return best, scores, scorer.evaluated - evaluated, literal_similarity.computed - computed
+
+
+def main(argv: list = None) -> None:
+    global scorer, literal_similarity, candidate_selections
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--candidate_file', type=str, default='data/candidates_embedding.parquet.zip')
+    parser.add_argument('--candidate_embeddings', type=str, default='data/candidates_embedding.npy', help='float32 label embeddings aligned to the rows of candidate_file')
+    parser.add_argument('--quantized', action='store_true', default=False, help='use the int8 label embeddings written by generate_embeddings.py --quantize')
+    parser.add_argument('--candidate_quantized', type=str, default='data/candidates_embedding.q8.npy', help='int8 label embeddings aligned to the rows of candidate_file')
+    parser.add_argument('--subject_file', type=str, default='data/subjects_embedding.parquet.zip')
+    parser.add_argument('--output_file', type=str, default='data/uslp-triplets.csv')
+    parser.add_argument('--geohash_precision', type=str, default='required files/geohash_precision.json')
+    parser.add_argument('--relation_types', type=str, default='required files/relation_types.json', help='candidate types allowed or preferred per relation')
+    parser.add_argument('--predicate_map', type=str, default='data/predicate_map.parquet')
+    parser.add_argument('--literal_map', type=str, default='data/literal_map.parquet')
+    parser.add_argument('--type_map', type=str, default='data/type_map.parquet')
+    parser.add_argument('--memory_budget', type=int, default=2048, help='memory in MB used for literal similarities and score blocks')
+    parser.add_argument('--prune', action='store_true', default=False, help='only score candidates in geohash cells that can reach the best score, gives the same matches')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes scoring subjects in parallel')
+    parser.add_argument('--chunk_size', type=int, default=10000, help='maximum number of distinct subjects scored per work unit')
+    parser.add_argument('--match_cache', type=str, default='data/match_cache.sqlite', help='sqlite database keeping matches across runs')
+    parser.add_argument('--no_match_cache', action='store_true', default=False, help='neither read nor write the match cache')
+    parser.add_argument('--match_cache_size', type=int, default=10000000, help='maximum number of matches kept in the match cache')
+    parser.add_argument('--report', action='store_true', default=False, help='report the candidate evaluations saved by the type restrictions per predicate')
+    parser.add_argument('--start_value', type=int, default=0, help='number of predicates to skip, useful for testing')
+    parser.add_argument('--resume', action='store_true', default=False, help='continue an interrupted run from the journal next to output_file')
+    parser.add_argument('--batch_size', type=int, default=10000, help='number of matches written and checkpointed at once')
+
+    args = parser.parse_args(argv)
+
+    print('Matching entities:')
+
+    candidates = pd.read_parquet(args.candidate_file)
+    if args.quantized:
+        # the per vector scales are not needed for cosine similarities
+        candidate_embeddings, _ = load_quantized_matrix(args.candidate_quantized)
+    else:
+        candidate_embeddings = load_matrix(args.candidate_embeddings)
+    subjects = pd.read_parquet(args.subject_file)
+
+    # precisions to use when comparing distances
+    with open(args.geohash_precision, 'r') as f:
+        geohash_precision_map = json.load(f)
+    # candidate types to consider per relation
+    relation_types = load_relation_types(args.relation_types)
+
+    # embeddings of unique predicates, literals and types as float32 matrices
+    predicate_keys, predicate_embeddings = load_embedding_map(args.predicate_map)
+    literal_keys, literal_embeddings = load_embedding_map(args.literal_map)
+    type_keys, type_embeddings = load_embedding_map(args.type_map)
+
+    print('- computing similarity scores')
+    # cosine similarity between literals and names, computed in blocks while matching
+    # every worker keeps its own literal similarities and score blocks
+    memory_budget = args.memory_budget * 1024 * 1024 // max(1, args.workers)
+    literal_similarity = LiteralSimilarity(candidate_embeddings, literal_embeddings, memory_budget // 2)
+
+    # cosine similarity matrix for similarity between predicates and types
+    cos_sim_predicate = cosine_similarity(type_embeddings, predicate_embeddings)
+
+    # introduce preselection step.
+    # need to group heads by predicate types
+    # find possible candidate types by type if contained in predicate
+
+    # precompute containment of candidate types in predicates
+    type_contained = np.zeros((len(predicate_keys), len(type_keys)), dtype=np.float64)
+    for p_code, predicate in enumerate(tqdm(predicate_keys, desc='- Computing type containment')):
+        for t_code, t in enumerate(type_keys):
+            if t != '<UNK>':
+                if str(t) in predicate:
+                    type_contained[p_code, t_code] = 0.5
+
+    # geohash cells of candidates and subjects per precision, encoded as positions in the sorted unique cells
+    candidate_cells = {}
+    subject_cells = {}
+    for p in set(geohash_precision_map.values()):
+        candidate_cells[p] = np.unique(candidates['geohash'].str[:p].to_numpy(dtype=str), return_inverse=True)
+        subject_cells[p] = np.unique(subjects['geohash'].str[:p].to_numpy(dtype=str), return_inverse=True)
+
+    print('- the following distance matrices will be used')
+    for precision in set(geohash_precision_map.values()):
+        print(f"- distance matrix prec = {precision}: ({len(candidate_cells[precision][0])}, {len(subject_cells[precision][0])})")
+
+    # precompute distances between unique cells for faster access
+    distance_matrices = {}
+    # largest distance per precision, matches depend on it through the normalization
+    normalization = {}
+    for p in tqdm(set(geohash_precision_map.values()), desc='- Computing distance matrices'):
+        distances = distance_matrix(subject_cells[p][0], candidate_cells[p][0])
+        # normalize to closeness
+        max_val = distances.max() if distances.size else 0
+        normalization[p] = max_val
+        if max_val > 0:
+            distances = 1 - (distances / max_val)
+        distance_matrices.update({p: distances.astype(np.float32)})
+
+    # integer codes of candidates and subjects for the scoring engine
+    type_codes = {t: code for code, t in enumerate(type_keys)}
+    predicate_codes = {pred: code for code, pred in enumerate(predicate_keys)}
+    literal_codes = {lit: code for code, lit in enumerate(literal_keys)}
+    subject_literals = subjects['literal'].map(literal_codes).to_numpy()
+    # a score block needs about 20 bytes per score: distances and sums in float64 and literal similarities in float32
+    scorer = USLPScorer(distance_matrices, {p: codes for p, (_, codes) in candidate_cells.items()},
+                        candidates['type'].map(type_codes).to_numpy(), cos_sim_predicate, literal_similarity, type_contained,
+                        block_size=memory_budget // 2 // 20, prune=args.prune)
+
+    # candidates considered for a predicate, restricted by type for faster runtime
+    type_index = TypeIndex(candidates['type'])
+    candidate_selections = {}
+
+
+    relations = subjects['predicate'].value_counts().index
+    # a new run empties or creates the output file, a run with start_value appends to it
+    writer = CheckpointWriter(args.output_file, header=['s', 'p', 'literal', 'o', 'score'] if args.start_value == 0 else None,
+                              resume=args.resume, batch_size=args.batch_size)
+    if writer.resumed and writer.journal['predicate'] is None and writer.relation > 0:
+        print(f'- {args.output_file} is complete, nothing to resume')
+        start_value = writer.relation
+    elif writer.resumed:
+        print(f'- resuming at predicate {writer.relation} ({writer.journal["predicate"]}) after {writer.scored} scored constellations and {writer.written} written subjects')
+        start_value = writer.relation
     else:
-        for index, row in tqdm(selected_subjects.iterrows(), total=len(selected_subjects), desc=f'- Finding matches {relation}'):
-            # save core properties for repetitive access
-            precision = geohash_precision_map[row['predicate']]
-            gh = row['geohash'][:precision]
-            pred = row['predicate']
-            lit = row['literal']
-            if (gh, pred, lit) in matched:  # only consider new constellations for subjects
-                # if these three values are the same, the uslp-score will also be the same
-                queue.put([row['uri'], pred, lit, matched[(gh, pred, lit)][0], matched[(gh, pred, lit)][1]])
-            else:
-                # prepare similarity and distance matrices for repetitive access
-                dm_precision = distance_matrices[precision].loc[gh, :]
-                cossim_matching_predicate = predicate_cossim_df.loc[:, pred]
-                cossim_matching_literal = literal_cossim_df.loc[:, lit]
-                contains_matching_predicate = type_contained.loc[pred, :]
-
-                # iterate through candidates and compute uslp-score
-                candidate_eval = selected_candidates.apply(
-                    lambda cand: dm_precision.loc[cand['geohash'][:precision]]
-                                 + cossim_matching_predicate.loc[cand['type']]
-                                 + cossim_matching_literal.loc[cand.name]
-                                 + contains_matching_predicate.loc[cand['type']],
-                    axis=1
-                )
-
-                # find best candidate
-                best_candidate = candidate_eval.idxmax()
-                best_candidate_uri = candidates.loc[best_candidate, 'uri']
-                best_candidate_score = candidate_eval[best_candidate]
-
-                # store matches and save constellation
-                queue.put([row['uri'], pred, lit, best_candidate_uri, candidate_eval[best_candidate]])
-                matched.update({(gh, pred, lit): (best_candidate_uri, best_candidate_score)})
-
-stop_thread = True
-match_consumer.join()
-
-print(f'- {(len(subjects) - len(matched))/len(subjects)*100:.2f}% of computations performed with dictionary')
+        start_value = args.start_value
+        if start_value > 0:
+            print(f'- skinpping first {start_value} predicates:')
+            print(f"- {list(relations[:start_value])}")
+
+    uris = candidates['uri'].to_numpy()
+    candidate_positions = {uri: position for position, uri in enumerate(uris)}
+    subject_uris = subjects['uri'].to_numpy()
+    subject_literal_values = subjects['literal'].to_numpy()
+    cache = None
+    if not args.no_match_cache:
+        fingerprint = candidate_fingerprint(candidates, candidate_embeddings, normalization, geohash_precision_map,
+                                            [(literal_keys, literal_embeddings), (type_keys, type_embeddings),
+                                             (predicate_keys, predicate_embeddings)])
+        cache = MatchCache(args.match_cache, fingerprint, args.match_cache_size)
+
+    # split the predicates into work units of at most chunk_size distinct constellations
+    subject_positions = subjects.groupby('predicate').indices
+    plans = []
+    units = []
+    cached = []
+    report = []
+    scored = 0
+    for relation_index, relation in enumerate(relations[start_value:], start_value):
+        selected, selection = type_index.select(relation, relation_types)
+        if selection is not None:
+            print(f'- restricting candidates for {relation} to {", ".join(selection)}')
+        if len(selected) == 0:
+            print(f'- no candidates for {relation}: skipping')
+            continue
+        preferred, preference = type_index.preferred(relation, relation_types)
+        if preference is not None:
+            print(f'- preferring {", ".join(preference)} for {relation} among candidates with the best score')
+        candidate_selections[(selection, preference)] = (selected, preferred)
+        # matches depend on the candidate types, so restricted and preferring predicates get their own cache entries
+        cache_predicate = relation if selection is None else f'{relation}|{",".join(selection)}'
+        if preference is not None:
+            cache_predicate += f'|preferred:{",".join(preference)}'
+
+        precision = geohash_precision_map[relation]
+        positions = subject_positions[relation]
+        cells = subject_cells[precision][1][positions]
+        literals = subject_literals[positions]
+        # only score new constellations, if geohash, predicate and literal are the same, the uslp-score will also be the same
+        _, first, inverse = np.unique(cells * len(literal_keys) + literals, return_index=True, return_inverse=True)
+        # constellations of the predicate of the journal that are in the memo are not scored again
+        memorized = writer.scored if writer.resumed and relation_index == writer.relation else 0
+        geohashes = subject_cells[precision][0][cells[first[memorized:]]]
+        literal_values = subject_literal_values[positions[first[memorized:]]].astype(str)
+        # matches of earlier runs with the same candidates are read from the cache
+        if cache is not None:
+            found, cached_uris, cached_scores = cache.get(cache_predicate, geohashes, literal_values)
+        else:
+            found, cached_uris, cached_scores = np.zeros(len(geohashes), dtype=bool), np.empty(len(geohashes), dtype=object), np.zeros(len(geohashes))
+        chunks = range(memorized, len(first), args.chunk_size)
+        for start in chunks:
+            constellations = first[start:start + args.chunk_size]
+            part = slice(start - memorized, start - memorized + args.chunk_size)
+            missing = ~found[part]
+            units.append((precision, predicate_codes[relation], (selection, preference), cells[constellations][missing], literals[constellations][missing]))
+            cached.append((missing, geohashes[part][missing], literal_values[part][missing],
+                           np.array([candidate_positions[uri] for uri in cached_uris[part][~missing]], dtype=np.int64),
+                           cached_scores[part][~missing]))
+        plans.append((relation_index, relation, cache_predicate, positions, inverse, len(chunks)))
+        scored += len(first)
+        report.append((relation, len(selected), int((~found).sum()), selection))
+
+    # workers are forked after the matrices are computed and share them with this process
+    pool = multiprocessing.get_context('fork').Pool(args.workers) if args.workers > 1 else None
+    results = pool.imap(score_unit, units) if pool is not None else map(score_unit, units)
+    results = zip(results, cached)
+
+    pbar = tqdm(total=len(units), desc='Matching by predicate:')
+    # results arrive in the order of the units, so rows are written in the same order for any number of workers
+    # scores can differ by float32 rounding, the tiles of literal similarities depend on the memory budget per worker
+    for relation_index, relation, cache_predicate, positions, inverse, n_units in plans:
+        pbar.set_postfix_str(f'{relation}')
+        writer.start_relation(relation_index, relation)
+        for _ in range(n_units):
+            (unit_best, unit_scores, evaluated, computed), (missing, geohashes, literal_values, cached_best, cached_scores) = next(results)
+            if cache is not None:
+                cache.put(cache_predicate, geohashes, literal_values, uris[unit_best], unit_scores)
+            if not missing.all():
+                best = np.zeros(len(missing), dtype=np.int64)
+                scores = np.zeros(len(missing), dtype=np.float64)
+                best[missing], best[~missing] = unit_best, cached_best
+                scores[missing], scores[~missing] = unit_scores, cached_scores
+                unit_best, unit_scores = best, scores
+            writer.add_scores(unit_best, unit_scores, evaluated, computed)
+            pbar.update()
+        best, scores = writer.memo()
+        best = best[inverse]
+        scores = scores[inverse]
+
+        # store matches in the order of the subjects, skipping subjects written before a restart
+        done = writer.written
+        positions = positions[done:]
+        writer.write(zip(subject_uris[positions], [relation] * len(positions), subject_literal_values[positions],
+                         uris[best[done:]], scores[done:]))
+    pbar.close()
+    writer.start_relation(len(relations), None)
+    writer.close()
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+    if cache is not None:
+        cache.close()
+
+    print(f'- {(len(subjects) - scored)/len(subjects)*100:.2f}% of computations performed with dictionary')
+    if cache is not None and cache.hits + cache.misses > 0:
+        print(f'- match cache: {cache.hits} hits, {cache.misses} misses ({cache.hits / (cache.hits + cache.misses) * 100:.2f}% hit rate)')
+    if args.report:
+        print('- candidate evaluations saved by type restrictions:')
+        for relation, n_selected, n_scored, selection in report:
+            print(f"  - {relation}: {n_selected}/{len(candidates)} candidates{'' if selection is None else ' of type ' + ', '.join(selection)}, "
+                  f"{n_scored} distinct subjects scored, {n_scored * (len(candidates) - n_selected)} evaluations saved")
+    print(f'- {writer.journal["evaluated"]} candidate scores evaluated, similarities computed for {writer.journal["computed"]} literals')
+
+    # release the matrices when called from the pipeline, the next stages run in the same process
+    scorer, literal_similarity, candidate_selections = None, None, {}
+
+
+if __name__ == '__main__':
+    main()
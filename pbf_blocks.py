@@ -0,0 +1,88 @@
+import struct
+
+
+def _read_varint(buf: bytes, pos: int) -> tuple:
+    """
+    decode a protobuf varint
+    :param buf: buffer to read from
+    :param pos: position of the first byte
+    :return: decoded value and position after the varint
+    """
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        result |= (b & 0x7f) << shift
+        pos += 1
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _parse_blob_header(buf: bytes) -> tuple:
+    """
+    extract type and data size from a serialized BlobHeader message
+    :param buf: serialized BlobHeader
+    :return: blob type and size of the following blob in bytes
+    """
+    blob_type = None
+    datasize = None
+    pos = 0
+    while pos < len(buf):
+        key, pos = _read_varint(buf, pos)
+        field, wire = key >> 3, key & 0x7
+        if wire == 0:
+            value, pos = _read_varint(buf, pos)
+            if field == 3:
+                datasize = value
+        elif wire == 2:
+            length, pos = _read_varint(buf, pos)
+            if field == 1:
+                blob_type = buf[pos:pos + length].decode()
+            pos += length
+        else:
+            raise ValueError(f'unexpected wire type {wire} in pbf blob header')
+    return blob_type, datasize
+
+
+def read_blob_index(pbf_file: str) -> tuple:
+    """
+    list the blocks of a pbf file without decompressing them
+    :param pbf_file: location of the pbf file
+    :return: (offset, length) of the OSMHeader block and list of (offset, length) of all OSMData blocks
+    """
+    header = None
+    blocks = []
+    with open(pbf_file, 'rb') as f:
+        while True:
+            offset = f.tell()
+            size = f.read(4)
+            if len(size) < 4:
+                break
+            header_size = struct.unpack('>I', size)[0]
+            blob_type, datasize = _parse_blob_header(f.read(header_size))
+            f.seek(datasize, 1)
+            length = 4 + header_size + datasize
+            if blob_type == 'OSMHeader':
+                header = (offset, length)
+            elif blob_type == 'OSMData':
+                blocks.append((offset, length))
+    if header is None:
+        raise ValueError(f'{pbf_file} has no OSMHeader block')
+    return header, blocks
+
+
+def read_blocks(pbf_file: str, header: tuple, blocks: list) -> bytes:
+    """
+    assemble a valid pbf buffer from the header and a subset of data blocks
+    :param pbf_file: location of the pbf file
+    :param header: (offset, length) of the OSMHeader block
+    :param blocks: list of (offset, length) of the OSMData blocks to include
+    :return: pbf encoded buffer
+    """
+    parts = []
+    with open(pbf_file, 'rb') as f:
+        for offset, length in [header] + list(blocks):
+            f.seek(offset)
+            parts.append(f.read(length))
+    return b''.join(parts)
@@ -0,0 +1,172 @@
+import gc
+import hashlib
+import importlib
+import json
+import os
+import time
+from datetime import timedelta
+
+
+class Stage:
+    """
+    a step of the pipeline: the main function of a module called with command line arguments
+    """
+    def __init__(self, module: str, argv: list, inputs: list, outputs: list):
+        """
+        :param module: name of the module whose main(argv) runs the stage, e.g. match_entities
+        :param argv: command line arguments passed to main, they are part of the fingerprint
+        :param inputs: files or directories read by the stage
+        :param outputs: files written by the stage
+        """
+        self.name = module
+        self.module = module
+        self.argv = [str(arg) for arg in argv]
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+
+
+class Pipeline:
+    """
+    run stages in-process in the order of their dependencies and skip stages that are up to date
+    a stage is up to date if its fingerprint, a hash of its arguments and the content of its inputs, is the one of its
+    last run and its outputs are unchanged since then. stages depend on each other through their files, so a stage
+    that is run again but writes the same outputs does not invalidate the stages after it.
+    """
+    def __init__(self, stages: list, state_file: str = 'data/.stages.json'):
+        """
+        :param stages: list of Stage objects
+        :param state_file: json file recording the fingerprints and outputs of finished stages
+        """
+        self.stages = self.order(stages)
+        self.state_file = state_file
+        self.state = {'stages': {}, 'files': {}}
+        if os.path.exists(state_file):
+            with open(state_file, 'r') as f:
+                self.state = json.load(f)
+
+    @staticmethod
+    def order(stages: list) -> list:
+        """
+        sort stages so that every stage runs after the stages writing its inputs
+        :param stages: list of Stage objects
+        :return: sorted list of the stages
+        """
+        producers = {os.path.normpath(output): stage for stage in stages for output in stage.outputs}
+        ordered, visiting = [], set()
+
+        def visit(stage: Stage) -> None:
+            if stage in ordered:
+                return
+            if stage.name in visiting:
+                raise ValueError(f'stage {stage.name} depends on its own outputs')
+            visiting.add(stage.name)
+            for path in stage.inputs:
+                producer = producers.get(os.path.normpath(path))
+                if producer is not None and producer is not stage:
+                    visit(producer)
+            visiting.discard(stage.name)
+            ordered.append(stage)
+
+        for stage in stages:
+            visit(stage)
+        return ordered
+
+    def digest(self, path: str) -> str:
+        """
+        hash the content of a file or of all files in a directory
+        digests are kept with the size and modification time of the file, so unchanged files are not read again
+        :param path: location of the file or directory
+        :return: hex digest of the content
+        """
+        if os.path.isdir(path):
+            h = hashlib.sha1()
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for file in sorted(files):
+                    h.update(os.path.relpath(os.path.join(root, file), path).encode('utf-8'))
+                    h.update(self.digest(os.path.join(root, file)).encode('ascii'))
+            return h.hexdigest()
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        known = self.state['files'].get(key)
+        if known is not None and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return known[2]
+        h = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 24), b''):
+                h.update(chunk)
+        self.state['files'][key] = [stat.st_size, stat.st_mtime_ns, h.hexdigest()]
+        return h.hexdigest()
+
+    def fingerprint(self, stage: Stage) -> str:
+        """
+        :param stage: Stage object whose inputs exist
+        :return: hex digest over the module, the arguments and the content of the inputs of the stage
+        """
+        h = hashlib.sha1()
+        h.update(json.dumps([stage.module, stage.argv]).encode('utf-8'))
+        for path in stage.inputs:
+            h.update(self.digest(path).encode('ascii'))
+        return h.hexdigest()
+
+    def valid(self, stage: Stage, fingerprint: str) -> bool:
+        """
+        :return: True if the last run of the stage had the same fingerprint and its outputs were not changed since
+        """
+        record = self.state['stages'].get(stage.name)
+        if record is None or record['fingerprint'] != fingerprint:
+            return False
+        for path in stage.outputs:
+            if not os.path.isfile(path):
+                return False
+            stat = os.stat(path)
+            if record['outputs'].get(path) != [stat.st_size, stat.st_mtime_ns]:
+                return False
+        return True
+
+    def save(self) -> None:
+        """
+        write the state file, replacing it at once so an interrupted write keeps the previous state
+        """
+        os.makedirs(os.path.dirname(self.state_file) or '.', exist_ok=True)
+        with open(self.state_file + '.tmp', 'w') as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(self.state_file + '.tmp', self.state_file)
+
+    def run(self, force: list = None) -> list:
+        """
+        run the stages that are not up to date
+        :param force: names of stages to run even if they are up to date, all stages if empty
+        :return: list of (stage name, True if skipped, runtime in seconds)
+        """
+        summary = []
+        for stage in self.stages:
+            start = time.time()
+            fingerprint = self.fingerprint(stage)
+            forced = force is not None and (not force or stage.name in force)
+            if not forced and self.valid(stage, fingerprint):
+                print(f'- {stage.name}: outputs are up to date, skipping')
+                summary.append((stage.name, True, time.time() - start))
+                continue
+            print(f'- {stage.name}: running')
+            # the stage is recorded as finished only after it returned
+            self.state['stages'].pop(stage.name, None)
+            self.save()
+            importlib.import_module(stage.module).main(stage.argv)
+            gc.collect()
+            self.state['stages'][stage.name] = {
+                'fingerprint': fingerprint,
+                'outputs': {path: [os.stat(path).st_size, os.stat(path).st_mtime_ns] for path in stage.outputs}}
+            self.save()
+            summary.append((stage.name, False, time.time() - start))
+        return summary
+
+    @staticmethod
+    def report(summary: list) -> None:
+        """
+        print which stages were skipped
+        :param summary: list returned by run
+        """
+        print(f'- stage cache: {sum(skipped for _, skipped, _ in summary)}/{len(summary)} stages up to date')
+        for name, skipped, seconds in summary:
+            print(f"  - {name}: {'cached' if skipped else 'ran'} in {timedelta(seconds=seconds)}")
@@ -0,0 +1,75 @@
+import json
+import numpy as np
+
+
+def load_relation_types(relation_type_file: str) -> dict:
+    """
+    read the candidate types per relation
+    every relation maps to {"allowed": [...]} to only consider candidates of these types, or to {"preferred": [...]}
+    to consider all candidates and prefer these types among candidates with the same best score. relations that are
+    not listed consider all candidates
+    :param relation_type_file: location of the json file
+    :return: dictionary of relation -> rule
+    """
+    with open(relation_type_file, 'r') as f:
+        relation_types = json.load(f)
+    for relation, rule in relation_types.items():
+        if set(rule) - {'allowed', 'preferred'} or len(rule) != 1:
+            raise ValueError(f'{relation} needs exactly one of "allowed" or "preferred" in {relation_type_file}')
+    return relation_types
+
+
+class TypeIndex:
+    """
+    positions of candidates grouped by type
+    candidates are sorted by type once, the candidates of a type are a slice of the sorted positions
+    """
+    def __init__(self, candidate_types):
+        """
+        :param candidate_types: type of every candidate
+        """
+        self.types, codes = np.unique(np.asarray(candidate_types, dtype=str), return_inverse=True)
+        self.order = np.argsort(codes, kind='stable')
+        self.bounds = np.searchsorted(codes[self.order], np.arange(len(self.types) + 1))
+        self.codes = {t: code for code, t in enumerate(self.types)}
+        self.size = len(codes)
+
+    def rows(self, candidate_type: str) -> np.ndarray:
+        """
+        :param candidate_type: name of the type
+        :return: ascending positions of the candidates of the type
+        """
+        code = self.codes.get(candidate_type)
+        if code is None:
+            return self.order[:0]
+        return self.order[self.bounds[code]:self.bounds[code + 1]]
+
+    def _positions(self, types: list) -> np.ndarray:
+        return np.sort(np.concatenate([self.rows(t) for t in types] + [self.order[:0]]))
+
+    def select(self, relation: str, relation_types: dict) -> tuple:
+        """
+        candidates to consider for a relation
+        :param relation: name of the relation
+        :param relation_types: rules returned by load_relation_types
+        :return: ascending positions of the candidates and the types they were restricted to, None if not restricted
+        """
+        types = relation_types.get(relation, {}).get('allowed')
+        if types is None:
+            return np.arange(self.size), None
+        return self._positions(types), tuple(types)
+
+    def preferred(self, relation: str, relation_types: dict) -> tuple:
+        """
+        candidates that win ties for the best score of a relation
+        :param relation: name of the relation
+        :param relation_types: rules returned by load_relation_types
+        :return: boolean mask over all candidates and the preferred types, None and None if no candidate is preferred
+        """
+        types = relation_types.get(relation, {}).get('preferred')
+        positions = self._positions(types) if types is not None else self.order[:0]
+        if len(positions) == 0:
+            return None, None
+        mask = np.zeros(self.size, dtype=bool)
+        mask[positions] = True
+        return mask, tuple(types)
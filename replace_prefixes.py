@@ -1,48 +1,50 @@
 import argparse
 import re
-import shutil
-import io
 import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from ttl_io import read_header, replace_prefix_uris, copy_body
 
 def replace_and_save(replacements: dict, input_file: str, output_file:str) -> None:
-    prefixes = []
-
+    """
+    rewrite the @prefix header of a turtle file, the body is copied without reading it into memory
+    if input and output are the same file the result is written to a temporary file next to it and renamed,
+    so the file is replaced atomically
+    :param replacements: dictionary of prefix name -> new uri
+    :param input_file: turtle file to read
+    :param output_file: file to write to, may be input_file
+    """
     # read unique prefixes and find end of prefix enumeration
     print('- reading prefixes')
-    with open(input_file, 'r') as file:
-        line = next(file)
-        pos = 0
-        while re.match(r'^@prefix.*', line):
-            if line.strip() not in prefixes:
-                prefixes.append(line.strip())
-            pos += 1
-            try:
-                line = next(file)
-            except StopIteration:
-                break
-
-    prefix_ends = pos
+    prefixes = []
+    header, prefix_end = read_header(input_file)
+    for prefix in header:
+        if prefix not in prefixes:
+            prefixes.append(prefix)
 
-    for pos, prefix in enumerate(prefixes):
-        parts = prefix.split(' ')
-        if parts[1][:-1] in replacements:
-            parts[2] = f'<{replacements[parts[1][:-1]]}>'
-            prefixes[pos] = ' '.join(parts)
+    prefixes = replace_prefix_uris(prefixes, replacements)
 
-    with open(output_file, 'wb') as target:
-        # write list of prefixes
-        print(f'- writing prefixes')
-        for prefix in prefixes:
-            prefix += '\n'
-            b = prefix.encode()
-            p_encoded = io.BytesIO(b)
-            shutil.copyfileobj(p_encoded, target)
-        # concatenate data
-        start_line = prefix_ends
-        with open(input_file, 'rb') as source:
-            lines = source.readlines()
-            b = io.BytesIO(b''.join(lines[start_line:]))
-            shutil.copyfileobj(b, target)
+    in_place = os.path.exists(output_file) and os.path.samefile(input_file, output_file)
+    if in_place:
+        handle, target_file = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(os.path.abspath(output_file)))
+        os.close(handle)
+    else:
+        target_file = output_file
+    try:
+        with open(target_file, 'wb') as target:
+            # write list of prefixes
+            print(f'- writing prefixes')
+            target.write(''.join(prefix + '\n' for prefix in prefixes).encode())
+            # copy data after the header
+            copy_body(input_file, prefix_end, target)
+        if in_place:
+            shutil.copymode(input_file, target_file)
+            os.replace(target_file, output_file)
+    except BaseException:
+        if in_place and os.path.exists(target_file):
+            os.remove(target_file)
+        raise
 
 
 def main() -> None:
@@ -53,7 +55,9 @@ def main() -> None:
     output_opt = parser.add_mutually_exclusive_group(required=True)
     output_opt.add_argument('--output_file', type=str, help='name of outputfile to write to')
     output_opt.add_argument('--output_dir', type=str, help='name of output directory to write to')
+    output_opt.add_argument('--in_place', action='store_true', default=False, help='replace the input files, each file is written to a temporary file and renamed')
     parser.add_argument('--replacement_pairs', required=True, nargs='+', type=str, help='list of prefixes to replace. Input as prefix=replacement')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes used for directories')
     args = parser.parse_args()
 
     # parse replacements
@@ -63,19 +67,22 @@ def main() -> None:
         replacements.update({prefix: uri})
 
     # run renaming
-    if args.input_file and args.output_file:
-        replace_and_save(replacements, args.input_file, args.output_file)
+    if args.input_file and (args.output_file or args.in_place):
+        replace_and_save(replacements, args.input_file, args.input_file if args.in_place else args.output_file)
 
-    elif args.input_dir and args.output_dir:
+    elif args.input_dir and (args.output_dir or args.in_place):
+        output_dir = args.input_dir if args.in_place else args.output_dir
         # create output directory
-        if not os.path.exists(args.output_dir):
-            os.mkdir(args.output_dir)
+        if not os.path.exists(output_dir):
+            os.mkdir(output_dir)
 
-        # loop input directory
-        for s in os.listdir(args.input_dir):
-            if re.match(r'.*.ttl$', s):
-                print(f'processing: {s}')
-                replace_and_save(replacements, os.path.join(args.input_dir, s), os.path.join(args.output_dir, s))
+        # process the files of the input directory in parallel
+        names = [s for s in os.listdir(args.input_dir) if re.match(r'.*.ttl$', s)]
+        with ProcessPoolExecutor(max(1, args.workers)) as pool:
+            futures = [pool.submit(replace_and_save, replacements, os.path.join(args.input_dir, s), os.path.join(output_dir, s)) for s in names]
+            for s, future in zip(names, futures):
+                future.result()
+                print(f'processed: {s}')
 
     else:
         raise Exception('input and output are not set or types do not match')
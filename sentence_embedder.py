@@ -0,0 +1,98 @@
+import multiprocessing
+import numpy as np
+import scipy.sparse
+
+# word vectors used by the lookup workers, inherited from the parent process when forking
+_wv = None
+_dim = None
+
+
+def _lookup(words: list) -> np.ndarray:
+    """
+    fetch the vectors of distinct words, words unknown to the model get a zero vector
+    :param words: list of distinct words
+    :return: float64 matrix with one vector per word
+    """
+    vectors = np.zeros((len(words), _dim), dtype=np.float64)
+    for i, word in enumerate(words):
+        if word in _wv:
+            vectors[i] = _wv[word]
+    return vectors
+
+
+class SentenceEmbedder:
+    """
+    average word vectors for many sentences at once
+    sentences are split on spaces like in the original per row embedding, every distinct word is looked up a single
+    time and kept in a cache shared by all calls. sentence means are computed as a sparse product of word weights
+    and the cached word vectors. words unknown to the model count as zero vectors.
+    """
+    def __init__(self, wv, dim: int = 300, workers: int = 1, batch_size: int = 100000, chunk_size: int = 20000):
+        """
+        :param wv: word vectors supporting `word in wv` and `wv[word]`, e.g. the wv attribute of a fasttext model
+        :param dim: size of the word vectors
+        :param workers: number of processes used to look up new words
+        :param batch_size: number of sentences averaged at once, bounds the size of intermediate matrices
+        :param chunk_size: number of words looked up per task when using several workers
+        """
+        self.wv = wv
+        self.dim = dim
+        self.workers = workers
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+
+        self.vocab = {}
+        self.words = []
+        self.vectors = np.zeros((0, dim), dtype=np.float64)
+
+    def _fetch(self, words: list) -> np.ndarray:
+        global _wv, _dim
+        _wv, _dim = self.wv, self.dim
+        if self.workers > 1 and len(words) > self.chunk_size:
+            chunks = [words[i:i + self.chunk_size] for i in range(0, len(words), self.chunk_size)]
+            with multiprocessing.get_context('fork').Pool(self.workers) as pool:
+                return np.vstack(pool.map(_lookup, chunks))
+        return _lookup(words)
+
+    def _weights(self, sentences) -> scipy.sparse.csr_matrix:
+        """
+        tokenize sentences and look up words that have not been seen before
+        :param sentences: iterable of strings
+        :return: sparse matrix with the weight of every word in every sentence
+        """
+        codes = []
+        indptr = [0]
+        for sentence in sentences:
+            for word in sentence.split(' '):  # splitting to avoid parsing as subwords
+                code = self.vocab.get(word)
+                if code is None:
+                    code = self.vocab[word] = len(self.words)
+                    self.words.append(word)
+                codes.append(code)
+            indptr.append(len(codes))
+
+        if len(self.words) > len(self.vectors):
+            self.vectors = np.vstack([self.vectors, self._fetch(self.words[len(self.vectors):])])
+
+        counts = np.diff(indptr)
+        weights = np.repeat(1.0 / np.maximum(counts, 1), counts)
+        return scipy.sparse.csr_matrix((weights, codes, indptr), shape=(len(indptr) - 1, len(self.words)))
+
+    def embed(self, sentences: list, names: list = None) -> np.ndarray:
+        """
+        compute the average word embedding of every sentence
+        :param sentences: list of strings to embed
+        :param names: optional list of names, averaged with the sentence embedding unless the name is <UNK>
+        :return: float32 matrix with one embedding per sentence
+        """
+        embeddings = np.zeros((len(sentences), self.dim), dtype=np.float32)
+        for start in range(0, len(sentences), self.batch_size):
+            end = min(start + self.batch_size, len(sentences))
+            batch = self._weights(sentences[start:end]) @ self.vectors
+            if names is not None:
+                known = np.array([name != '<UNK>' for name in names[start:end]], dtype=bool)
+                if known.any():
+                    named = self._weights([name for name, k in zip(names[start:end], known) if k]) @ self.vectors
+                    batch[known] = (batch[known] + named) / 2
+            embeddings[start:end] = batch
+        return embeddings
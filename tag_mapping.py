@@ -0,0 +1,153 @@
+import argparse
+import hashlib
+import os
+import pickle
+import random
+import time
+import pandas as pd
+
+
+def to_camel_case_class(word: str) -> str:
+    word = word.replace(':', '_')
+    return ''.join(x.capitalize() or '_' for x in word.split('_'))
+
+
+def to_camel_case_key(input_str: str) -> str:
+    input_str = input_str.replace(':', '_')
+    words = input_str.split('_')
+    return words[0] + "".join(x.title() for x in words[1:])
+
+
+def fingerprint(*files: str) -> str:
+    """
+    hash the content of the files a mapping is compiled from
+    :param files: locations of the source files
+    :return: hex digest over all file contents
+    """
+    h = hashlib.sha1()
+    for file in files:
+        with open(file, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+class TagMapping:
+    """
+    precompiled lookup tables from osm tags to WorldKG schema names
+    classes maps (key, value) to the class of the entity, yes_classes maps keys of tags with value 'Yes' to a class,
+    predicates maps keys from the key list to their property name. all lookups are plain dictionary accesses.
+    """
+    def __init__(self, classes: dict, yes_classes: dict, predicates: dict, source: str = ''):
+        self.classes = classes
+        self.yes_classes = yes_classes
+        self.predicates = predicates
+        self.source = source
+
+    @classmethod
+    def compile(cls, feature_file: str, key_file: str) -> 'TagMapping':
+        """
+        build the lookup tables from the ontology map features and key list
+        :param feature_file: csv file containing key, value and appendedClass columns
+        :param key_file: csv file containing the list of keys to convert to properties
+        :return: compiled mapping
+        """
+        supersub = pd.read_csv(feature_file, sep='\t', encoding='utf-8').drop_duplicates()
+        key_list = pd.read_csv(key_file, sep='\t', encoding='utf-8')
+
+        classes = {}
+        for key, value, appended_class in zip(supersub['key'], supersub['value'], supersub['appendedClass']):
+            # the first row of a (key, value) pair decides the class
+            classes.setdefault((key, value), appended_class)
+        yes_classes = {key: to_camel_case_class(key) for key in supersub['key'].unique()}
+        predicates = {key: to_camel_case_key(key) for key in key_list['key'] if isinstance(key, str)}
+        return cls(classes, yes_classes, predicates, fingerprint(feature_file, key_file))
+
+    @classmethod
+    def load(cls, feature_file: str, key_file: str, cache_file: str = None) -> 'TagMapping':
+        """
+        load the mapping from cache_file if it was compiled from the same source files, otherwise compile and cache it
+        :param feature_file: csv file containing key, value and appendedClass columns
+        :param key_file: csv file containing the list of keys to convert to properties
+        :param cache_file: optional location of the compiled mapping
+        :return: compiled mapping
+        """
+        if cache_file and os.path.exists(cache_file):
+            with open(cache_file, 'rb') as f:
+                cached = pickle.load(f)
+            if cached.source == fingerprint(feature_file, key_file):
+                return cached
+        mapping = cls.compile(feature_file, key_file)
+        if cache_file:
+            # write atomically, several workers may load the cache at the same time
+            with open(f'{cache_file}.tmp{os.getpid()}', 'wb') as f:
+                pickle.dump(mapping, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f'{cache_file}.tmp{os.getpid()}', cache_file)
+        return mapping
+
+
+def benchmark(feature_file: str, key_file: str, n_tags: int) -> None:
+    """
+    compare tag resolution through pandas lookups against the compiled mapping
+    :param feature_file: csv file containing key, value and appendedClass columns
+    :param key_file: csv file containing the list of keys to convert to properties
+    :param n_tags: number of tags to resolve
+    """
+    supersub = pd.read_csv(feature_file, sep='\t', encoding='utf-8').drop_duplicates()
+    key_list = list(pd.read_csv(key_file, sep='\t', encoding='utf-8')['key'])
+    dict_class = supersub.groupby('key')['value'].apply(list).reset_index(name='subclasses').set_index('key').to_dict()['subclasses']
+    mapping = TagMapping.compile(feature_file, key_file)
+
+    # mix of class tags, property tags and tags that are ignored
+    random.seed(0)
+    pairs = list(zip(supersub['key'], supersub['value']))
+    tags = []
+    for _ in range(n_tags):
+        r = random.random()
+        if r < 0.4:
+            tags.append(random.choice(pairs))
+        elif r < 0.8:
+            tags.append((random.choice(key_list), 'some value'))
+        else:
+            tags.append(('unknown_key', 'some value'))
+
+    def resolve_pandas(k, v):
+        if k in dict_class:
+            if v in dict_class[k]:
+                return supersub.loc[(supersub['value'] == v) & (supersub['key'] == k)]['appendedClass'].values[0]
+        elif k in key_list:
+            return to_camel_case_key(k)
+
+    def resolve_compiled(k, v):
+        if k in mapping.yes_classes:
+            return mapping.classes.get((k, v))
+        return mapping.predicates.get(k)
+
+    results = {}
+    for name, resolve in [('pandas lookup', resolve_pandas), ('compiled mapping', resolve_compiled)]:
+        start = time.perf_counter()
+        results[name] = [resolve(k, v) for k, v in tags]
+        runtime = time.perf_counter() - start
+        print(f'- {name}: {n_tags / runtime:,.0f} tags/s')
+    if results['pandas lookup'] != results['compiled mapping']:
+        raise ValueError('compiled mapping differs from pandas lookup')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--osm_features', type=str, default='required files/OSM_Ontology_map_features.csv')
+    parser.add_argument('--key_list', type=str, default='required files/Key_List.csv')
+    parser.add_argument('--cache_file', type=str, default='data/tag_mapping.pickle', help='location to write the compiled mapping to')
+    parser.add_argument('--benchmark', action='store_true', default=False, help='compare tags per second against pandas lookups')
+    parser.add_argument('--n_tags', type=int, default=20000, help='number of tags to resolve in the benchmark')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print('Benchmarking tag mapping:')
+        benchmark(args.osm_features, args.key_list, args.n_tags)
+    else:
+        mapping = TagMapping.load(args.osm_features, args.key_list, args.cache_file)
+        print(f'- compiled {len(mapping.classes)} classes and {len(mapping.predicates)} properties to {args.cache_file}')
+
+
+if __name__ == '__main__':
+    main()
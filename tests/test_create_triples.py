@@ -0,0 +1,156 @@
+import os
+import sys
+
+import osmium
+import pytest
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import create_triples  # noqa: E402
+
+REQUIRED = os.path.join(ROOT, 'required files')
+
+
+def write_nodes(pbf_file, count):
+    """
+    write tagged nodes that become candidates (odd ids) and subjects (even ids)
+    libosmium starts a new pbf block every 8000 objects, so larger counts give several blocks
+    """
+    with osmium.SimpleWriter(str(pbf_file)) as writer:
+        for i in range(1, count + 1):
+            if i % 2:
+                tags = {'name': f'City {i}', 'name:en': f'City {i}', 'place': 'city', 'population': str(i)}
+            else:
+                tags = {'name': f'Shop {i}', 'addr:country': f'Country {i % 7}', 'shop': 'bakery'}
+            writer.add_node(osmium.osm.mutable.Node(id=i, location=(i % 360 - 180 + 0.5, (i % 170) - 85 + 0.25),
+                                                    tags=tags))
+
+
+def run(tmp_path, name, pbf_file, *options):
+    out = tmp_path / name
+    out.mkdir()
+    create_triples.main(['--input_file', str(pbf_file), '--output_file', str(out / 'graph.ttl'),
+                         '--osm_features', os.path.join(REQUIRED, 'OSM_Ontology_map_features.csv'),
+                         '--key_list', os.path.join(REQUIRED, 'Key_List.csv'),
+                         '--class_file', os.path.join(REQUIRED, 'relevant_classes.csv'),
+                         '--relation_file', os.path.join(REQUIRED, 'relations.csv'),
+                         '--entity_tables', '--candidate_file', str(out / 'candidates.parquet'),
+                         '--subject_file', str(out / 'subjects.parquet'),
+                         '--shard_dir', str(out / 'shards'), *options])
+    return out
+
+
+def test_workers_write_the_same_entity_tables(tmp_path):
+    pbf_file = tmp_path / 'nodes.osm.pbf'
+    write_nodes(pbf_file, 20000)
+
+    single = run(tmp_path, 'single', pbf_file)
+    sharded = run(tmp_path, 'sharded', pbf_file, '--workers', '2', '--blocks_per_chunk', '1')
+
+    for table in ['candidates.parquet', 'subjects.parquet']:
+        expected = pd.read_parquet(single / table)
+        assert len(expected) > 0
+        pd.testing.assert_frame_equal(pd.read_parquet(sharded / table), expected)
+    assert (sharded / 'graph.ttl').read_bytes() == (single / 'graph.ttl').read_bytes()
+
+
+def test_ring_area_centroid():
+    square = [(0, 0), (2, 0), (2, 2), (0, 2), (0, 0)]
+    area, centroid = create_triples.ring_area_centroid(square)
+    assert area == pytest.approx(4) and centroid == pytest.approx((1, 1))
+    # orientation does not change the area or the centroid
+    area, centroid = create_triples.ring_area_centroid(square[::-1])
+    assert area == pytest.approx(4) and centroid == pytest.approx((1, 1))
+    triangle = [(10, 50), (13, 50), (10, 53), (10, 50)]
+    area, centroid = create_triples.ring_area_centroid(triangle)
+    assert area == pytest.approx(4.5) and centroid == pytest.approx((11, 51))
+
+
+@pytest.mark.parametrize('ring', [[(1, 1), (2, 2), (3, 3), (1, 1)], [(5, 5), (5, 5), (5, 5), (5, 5)]],
+                         ids=['collinear', 'single point'])
+def test_zero_area_ring(ring):
+    assert create_triples.ring_area_centroid(ring) == (0.0, ring[0])
+
+
+def test_polygon_centroid():
+    outer = [(0, 0), (4, 0), (4, 4), (0, 4), (0, 0)]
+    hole = [(0, 0), (2, 0), (2, 2), (0, 2), (0, 0)]
+    assert create_triples.polygon_centroid([outer], []) == pytest.approx((2, 2))
+    # (16 * 2 - 4 * 1) / 12
+    assert create_triples.polygon_centroid([outer], [hole]) == pytest.approx((7 / 3, 7 / 3))
+    # rings of a multipolygon are weighted by their area
+    far = [(10, 0), (12, 0), (12, 2), (10, 2), (10, 0)]
+    assert create_triples.polygon_centroid([outer, far], []) == pytest.approx(((16 * 2 + 4 * 11) / 20, (16 * 2 + 4 * 1) / 20))
+
+
+def test_degenerate_polygon_uses_the_mean_of_its_vertices():
+    collinear = [(0, 0), (1, 1), (5, 5), (0, 0)]
+    assert create_triples.polygon_centroid([collinear], []) == pytest.approx((2, 2))
+    # a hole covering the whole polygon leaves no area
+    square = [(0, 0), (2, 0), (2, 2), (0, 2), (0, 0)]
+    assert create_triples.polygon_centroid([square], [square]) == pytest.approx((1, 1))
+
+
+# untagged nodes: a small square, a node east of it, a larger square with a hole inside for the multipolygon
+WAY_NODES = {1: (10.0, 50.0), 2: (10.002, 50.0), 3: (10.002, 50.002), 4: (10.0, 50.002), 5: (10.004, 50.0),
+             6: (11.0, 51.0), 7: (11.004, 51.0), 8: (11.004, 51.004), 9: (11.0, 51.004),
+             10: (11.001, 51.001), 11: (11.002, 51.001), 12: (11.002, 51.002), 13: (11.001, 51.002)}
+
+
+def write_ways(pbf_file):
+    with osmium.SimpleWriter(str(pbf_file)) as writer:
+        writer.add_node(osmium.osm.mutable.Node(id=100, location=(9.5, 49.5),
+                                                tags={'name': 'Town', 'place': 'town', 'population': '100'}))
+        for i, location in WAY_NODES.items():
+            writer.add_node(osmium.osm.mutable.Node(id=i, location=location))
+        # closed way
+        writer.add_way(osmium.osm.mutable.Way(id=20, nodes=[1, 2, 3, 4, 1],
+                                              tags={'name': 'Hall', 'building': 'yes', 'amenity': 'townhall'}))
+        # open way
+        writer.add_way(osmium.osm.mutable.Way(id=21, nodes=[1, 2, 5],
+                                              tags={'name': 'Main Street', 'highway': 'residential', 'ref': 'A1'}))
+        # too few tags
+        writer.add_way(osmium.osm.mutable.Way(id=22, nodes=[2, 5], tags={'highway': 'path'}))
+        # untagged members of the multipolygon, the type tag of the relation is not copied to its area
+        writer.add_way(osmium.osm.mutable.Way(id=23, nodes=[6, 7, 8, 9, 6]))
+        writer.add_way(osmium.osm.mutable.Way(id=24, nodes=[10, 11, 12, 13, 10]))
+        writer.add_relation(osmium.osm.mutable.Relation(id=30, members=[('w', 23, 'outer'), ('w', 24, 'inner')],
+                                                        tags={'type': 'multipolygon', 'name': 'Forest',
+                                                              'landuse': 'forest', 'leaf_type': 'mixed'}))
+
+
+def points(graph_file):
+    geo = 'wkg:geo'
+    result = {}
+    for line in graph_file.read_text().splitlines():
+        if line.startswith(geo) and ' geo:asWKT ' in line:
+            lon, lat = line.split('"')[1][len('Point('):-1].split()
+            result[line.split()[0][len(geo):]] = (float(lon), float(lat))
+    return result
+
+
+def triple_count(graph_file):
+    return sum(1 for line in graph_file.read_text().splitlines() if line and not line.startswith('@prefix'))
+
+
+@pytest.mark.parametrize('options', [[], ['--workers', '2', '--blocks_per_chunk', '1']], ids=['single', 'workers'])
+def test_way_and_area_entities(tmp_path, capsys, options):
+    pbf_file = tmp_path / 'ways.osm.pbf'
+    write_ways(pbf_file)
+
+    out = run(tmp_path, 'out', pbf_file, '--with_ways', '--location_file', str(tmp_path / 'nodes.bin'), *options)
+
+    located = points(out / 'graph.ttl')
+    assert set(located) == {'100', 'way20', 'way21', 'relation30'}
+    # centroid of the closed way, middle node of the open way
+    assert located['way20'] == pytest.approx((10.001, 50.001))
+    assert located['way21'] == WAY_NODES[2]
+    # (16 * 2 - 1 * 1.5) / 15 in units of 0.001 degrees
+    assert located['relation30'] == pytest.approx((11 + 0.001 * 30.5 / 15, 51 + 0.001 * 30.5 / 15))
+    assert not (tmp_path / 'nodes.bin').exists()
+
+    printed = capsys.readouterr().out
+    assert '- way/area pass: 3 entities from ' in printed
+    assert f'- wrote {triple_count(out / "graph.ttl")} triples' in printed
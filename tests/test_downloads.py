@@ -0,0 +1,104 @@
+import hashlib
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from downloads import Downloader, geofabrik_urls  # noqa: E402
+
+CONTENT = bytes(range(256)) * 4096
+MD5 = hashlib.md5(CONTENT).hexdigest()
+
+
+class MirrorHandler(BaseHTTPRequestHandler):
+    """
+    serves the files of the server in the geofabrik layout, with range requests like geofabrik
+    """
+    def _send(self, body: bool) -> None:
+        self.server.ranges.append(self.headers.get('Range'))
+        content = self.server.files.get(self.path)
+        if content is None:
+            self.send_error(404)
+            return
+        start = 0
+        if self.headers.get('Range'):
+            start = int(self.headers['Range'].split('=')[1].rstrip('-'))
+            if start >= len(content):
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(content) - 1}/{len(content)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(content) - start))
+        self.end_headers()
+        if body:
+            self.wfile.write(content[start:])
+
+    def do_GET(self):
+        self._send(True)
+
+    def do_HEAD(self):
+        self._send(False)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def mirror():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MirrorHandler)
+    server.ranges = []
+    server.files = {'/europe/liechtenstein-latest.osm.pbf': CONTENT,
+                    '/europe/liechtenstein-latest.osm.pbf.md5': f'{MD5}  liechtenstein-latest.osm.pbf\n'.encode()}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def download(mirror, target_file):
+    url, md5_url = geofabrik_urls('europe/liechtenstein', f'http://127.0.0.1:{mirror.server_port}/')
+    downloader = Downloader(workers=1, chunk_size=1 << 16)
+    try:
+        return downloader.submit(url, str(target_file), md5_url).result()
+    finally:
+        downloader.close()
+
+
+def test_download(mirror, tmp_path):
+    target_file = tmp_path / 'liechtenstein-latest.osm.pbf'
+    assert download(mirror, target_file) == str(target_file)
+    assert target_file.read_bytes() == CONTENT
+    assert not os.path.exists(f'{target_file}.part')
+    assert mirror.ranges == [None, None]
+
+    # a verified file is not downloaded again, only its checksum is requested
+    download(mirror, target_file)
+    assert len(mirror.ranges) == 3
+
+
+def test_resume_truncated_part_file(mirror, tmp_path):
+    target_file = tmp_path / 'liechtenstein-latest.osm.pbf'
+    (tmp_path / 'liechtenstein-latest.osm.pbf.part').write_bytes(CONTENT[:300000])
+
+    download(mirror, target_file)
+
+    assert target_file.read_bytes() == CONTENT
+    assert mirror.ranges == [None, 'bytes=300000-']
+
+
+def test_checksum_mismatch(mirror, tmp_path):
+    mirror.files['/europe/liechtenstein-latest.osm.pbf'] = CONTENT[:-1] + b'x'
+    target_file = tmp_path / 'liechtenstein-latest.osm.pbf'
+
+    with pytest.raises(ValueError, match='checksum'):
+        download(mirror, target_file)
+
+    assert not target_file.exists()
+    assert not os.path.exists(f'{target_file}.part')
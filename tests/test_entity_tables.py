@@ -0,0 +1,82 @@
+import os
+import sys
+
+import pytest
+from rdflib import Graph, Literal, Namespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from entity_tables import EntityTableBuilder, finalize  # noqa: E402
+from turtle_stream import TurtleReader  # noqa: E402
+
+WKG = Namespace('http://www.worldkg.org/resource/')
+WKGS = Namespace('http://www.worldkg.org/schema/')
+RDF = Namespace('http://www.w3.org/1999/02/22-rdf-syntax-ns#')
+RDFS = Namespace('http://www.w3.org/2000/01/rdf-schema#')
+GEO = Namespace('http://www.opengis.net/ont/geosparql#')
+SF = Namespace('http://www.opengis.net/ont/sf#')
+
+CLASSES = ['http://www.worldkg.org/schema/City', 'http://www.worldkg.org/schema/Country']
+RELATIONS = ['wkgs:isInCountry', 'wkgs:addrCountry']
+
+
+def entity(name, *statements):
+    """
+    triples of an entity and of its geo object in the order written by create_triples.py
+    """
+    s, geo = WKG[name], WKG['geo' + name]
+    return [(s, WKGS.spatialObject, geo), (geo, RDF.type, SF.Point),
+            (geo, GEO.asWKT, Literal(f'Point({len(name)} 1)', datatype=GEO.wktLiteral))] + [(s, p, o) for p, o in statements]
+
+
+TRIPLES = (entity('1', (RDF.type, WKGS.City), (RDFS.label, Literal('Bonn')), (WKGS.nameEn, Literal('Bonn')))
+           + entity('2', (RDF.type, WKGS.Country), (RDFS.label, Literal('Deutschland')))
+           + entity('3', (RDF.type, WKGS.Bakery), (WKGS.addrCountry, Literal('Deutschland')))
+           # neither a candidate nor a subject
+           + entity('4', (RDF.type, WKGS.Bakery), (RDFS.label, Literal('Backstube')))
+           + entity('way5', (RDF.type, WKGS.City), (RDFS.label, Literal('Köln')), (WKGS.isInCountry, Literal('DE'))))
+
+
+def rows(builder):
+    candidates, subjects = builder.frames()
+    return (sorted(map(tuple, finalize([candidates]).values.tolist())),
+            sorted(map(tuple, finalize([subjects]).values.tolist())))
+
+
+def build(triples, contiguous):
+    builder = EntityTableBuilder(WKGS, CLASSES, RELATIONS, contiguous=contiguous)
+    for triple in triples:
+        builder.add(triple)
+    return builder
+
+
+def test_contiguous_triples():
+    candidates, subjects = rows(build(TRIPLES, contiguous=True))
+    assert candidates == [('wkg:1', 'Bonn', 'Point(1 1)', 'City', 'Bonn'),
+                          ('wkg:2', 'Deutschland', 'Point(1 1)', 'Country', '<UNK>'),
+                          ('wkg:way5', 'Köln', 'Point(4 1)', 'City', '<UNK>')]
+    assert subjects == [('wkg:3', 'wkgs:addrCountry', 'Deutschland', 'Point(1 1)', 'Bakery'),
+                        ('wkg:way5', 'wkgs:isInCountry', 'DE', 'Point(4 1)', 'City')]
+
+
+@pytest.mark.parametrize('order', [lambda t: sorted(t, key=lambda triple: str(triple[0])),
+                                   lambda t: sorted(t, key=lambda triple: str(triple[0]), reverse=True)],
+                         ids=['entities first', 'geo objects first'])
+def test_geo_objects_apart_from_their_entity(order):
+    builder = build(order(TRIPLES), contiguous=False)
+    assert rows(builder) == rows(build(TRIPLES, contiguous=True))
+    # nothing is kept once every entity has found its location
+    assert (builder.records, builder.wkt, builder.pending, builder.ignored) == ({}, {}, {}, set())
+
+
+def test_pretty_turtle(tmp_path):
+    graph = Graph()
+    graph.bind('wkg', WKG)
+    graph.bind('wkgs', WKGS)
+    for triple in TRIPLES:
+        graph.add(triple)
+    graph_file = tmp_path / 'graph.ttl'
+    graph.serialize(str(graph_file), format='turtle')
+
+    builder = build(TurtleReader(str(graph_file)), contiguous=False)
+    assert rows(builder) == rows(build(TRIPLES, contiguous=True))
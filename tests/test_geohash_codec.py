@@ -0,0 +1,35 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geohash_codec import encode, wkt_to_geohash  # noqa: E402
+
+# (latitude, longitude) -> pygeohash 1.2.0 encode(latitude, longitude, precision=6)
+PYGEOHASH = {
+    # on the equator and the prime meridian
+    (0.0, 0.0): '7zzzzz',
+    (51.4778, 0.0): 'gcpuzg',
+    # on a dyadic midpoint of both intervals
+    (47.8125, 11.25): 'u0rzzz',
+    (45.0, 90.0): 'tzzzzz',
+    (-45.0, -90.0): '1zzzzz',
+    # corners of the world
+    (0.0, -180.0): '2pbpbp',
+    (90.0, 180.0): 'zzzzzz',
+    (-90.0, -180.0): '000000',
+    (50.7374, 7.0982): 'u1j09s',
+    (-33.8688, 151.2093): 'r3gx2f',
+}
+
+
+def test_encode_matches_pygeohash():
+    latitudes, longitudes = np.array(list(PYGEOHASH)).T
+    assert list(encode(latitudes, longitudes)) == list(PYGEOHASH.values())
+
+
+def test_wkt_to_geohash():
+    wkts = ['Point(0.0 51.4778)', 'Point(11.25 47.8125)', 'LineString(0 0, 1 1)']
+    assert list(wkt_to_geohash(wkts)) == ['gcpuzg', 'u0rzzz', '000000']
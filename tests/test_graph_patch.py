@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pytest
+from rdflib import Graph, URIRef
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from graph_patch import patch_graph  # noqa: E402
+
+NAMESPACES = {'wkg': 'http://www.worldkg.org/resource/', 'wkgs': 'http://www.worldkg.org/schema/',
+              'wd': 'http://www.wikidata.org/entity/'}
+
+FLAT = '''@prefix wkg: <http://www.worldkg.org/resource/> .
+@prefix wkgs: <http://www.worldkg.org/schema/> .
+@prefix wd: <http://www.wikidata.org/entity/> .
+
+wkg:1 wkgs:country "Germany" .
+wkg:1 wkgs:country wd:Q183 .
+wkg:2 wkgs:country wd:Q40 .
+'''
+
+PRETTY = '''@prefix wkg: <http://www.worldkg.org/resource/> .
+@prefix wkgs: <http://www.worldkg.org/schema/> .
+@prefix wd: <http://www.wikidata.org/entity/> .
+
+wkg:1 wkgs:country "Germany",
+        wd:Q183 .
+
+wkg:2 wkgs:country wd:Q40 .
+'''
+
+COUNTRY = 'http://www.worldkg.org/schema/country'
+ACCEPTED = {
+    # replaces a literal by a uri that is already in the graph
+    ('http://www.worldkg.org/resource/1', COUNTRY, 'Germany'): ['http://www.wikidata.org/entity/Q183'],
+    # a literal that is not in the graph, predicting a uri that is
+    ('http://www.worldkg.org/resource/2', COUNTRY, 'Austria'): ['http://www.wikidata.org/entity/Q40'],
+}
+
+
+@pytest.mark.parametrize('content', [FLAT, PRETTY], ids=['flat', 'pretty'])
+def test_existing_predictions_are_not_written_twice(tmp_path, content):
+    graph_file = tmp_path / 'graph.ttl'
+    graph_file.write_text(content)
+    output_file = tmp_path / 'patched.ttl'
+
+    replaced, added = patch_graph(str(graph_file), str(output_file), ACCEPTED, NAMESPACES)
+
+    assert (replaced, added) == (1, 0)
+    lines = [line for line in output_file.read_text().splitlines() if line and not line.startswith('@prefix')]
+    assert len(lines) == 2
+    graph = Graph().parse(str(output_file), format='turtle')
+    assert set(graph) == {
+        (URIRef('http://www.worldkg.org/resource/1'), URIRef(COUNTRY), URIRef('http://www.wikidata.org/entity/Q183')),
+        (URIRef('http://www.worldkg.org/resource/2'), URIRef(COUNTRY), URIRef('http://www.wikidata.org/entity/Q40')),
+    }
@@ -0,0 +1,46 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from match_cache import MatchCache, candidate_fingerprint  # noqa: E402
+
+CANDIDATES = pd.DataFrame({'uri': ['wkg:1', 'wkg:2'], 'type': ['City', 'Country'], 'geohash': ['u1hcy', 'u281z']})
+EMBEDDINGS = np.arange(6, dtype=np.float32).reshape(2, 3)
+LITERALS = (['Bonn', 'Köln'], np.ones((2, 3), dtype=np.float32))
+TYPES = (['City', 'Country'], np.eye(2, 3, dtype=np.float32))
+PREDICATES = (['wkgs:addrCity'], np.full((1, 3), 0.5, dtype=np.float32))
+
+
+def fingerprint(normalization={1: 1234.5, 3: 56.25}, precision={'wkgs:addrCity': 3}, literals=LITERALS):
+    return candidate_fingerprint(CANDIDATES, EMBEDDINGS, normalization, precision, [literals, TYPES, PREDICATES])
+
+
+def test_fingerprint_covers_the_scoring_inputs():
+    assert fingerprint() == fingerprint()
+    # a different set of subjects changes the largest distance used for normalization
+    assert fingerprint(normalization={1: 1234.5, 3: 56.250001}) != fingerprint()
+    assert fingerprint(precision={'wkgs:addrCity': 4}) != fingerprint()
+    assert fingerprint(literals=(LITERALS[0], LITERALS[1] * 2)) != fingerprint()
+    assert fingerprint(literals=(['Bonn', 'Aachen'], LITERALS[1])) != fingerprint()
+
+
+def test_entries_are_only_read_with_the_same_fingerprint(tmp_path):
+    cache_file = str(tmp_path / 'cache.sqlite')
+    cache = MatchCache(cache_file, fingerprint())
+    cache.put('wkgs:addrCity', ['u1h'], ['Bonn'], ['wkg:1'], [1.75])
+    cache.close()
+
+    cache = MatchCache(cache_file, fingerprint(normalization={1: 1234.5, 3: 60.0}))
+    found, _, _ = cache.get('wkgs:addrCity', ['u1h'], ['Bonn'])
+    assert not found.any()
+    cache.close()
+
+    cache = MatchCache(cache_file, fingerprint())
+    found, uris, scores = cache.get('wkgs:addrCity', ['u1h'], ['Bonn'])
+    assert found.all() and list(uris) == ['wkg:1'] and scores[0] == pytest.approx(1.75)
+    cache.close()
@@ -0,0 +1,90 @@
+import re
+from rdflib import Literal
+
+# local names that can be written as prefix:local without escaping
+SAFE_LOCAL = re.compile(r'^[A-Za-z0-9_](?:[A-Za-z0-9_.-]*[A-Za-z0-9_-])?$')
+
+
+def quote_literal(value: str) -> str:
+    """
+    escape a string for use as a short turtle literal
+    :param value: lexical form of the literal
+    :return: quoted literal string
+    """
+    value = value.replace('\\', '\\\\')
+    value = value.replace('"', '\\"')
+    value = value.replace('\n', '\\n')
+    value = value.replace('\r', '\\r')
+    return f'"{value}"'
+
+
+class TurtleLineWriter:
+    """
+    write triples as flat, prefix-compressed turtle with one triple per line
+    the output starts with the same @prefix header as rdflib, so it can be read by rdflib as well as
+    join_ttlfiles.py and replace_prefixes.py. triples are written to a buffered file as they arrive,
+    so memory use does not grow with the number of triples.
+    """
+    def __init__(self, output_file: str, namespaces: dict, buffer_size: int = 1 << 20, append: bool = False):
+        """
+        :param output_file: file to write triples to
+        :param namespaces: dictionary mapping prefixes to namespace uris
+        :param buffer_size: size of the write buffer in bytes
+        :param append: append to a file previously written with the same namespaces instead of creating it
+        """
+        self.file = open(output_file, 'a' if append else 'w', encoding='utf-8', buffering=buffer_size)
+        self.prefixes = {str(uri): prefix for prefix, uri in namespaces.items()}
+        self.count = 0
+
+        # duplicates can only occur within one entity, so only the current subject is tracked
+        self._subject = None
+        self._seen = set()
+
+        if not append:
+            for prefix, uri in sorted(namespaces.items()):
+                self.file.write(f'@prefix {prefix}: <{uri}> .\n')
+            self.file.write('\n')
+
+    def term(self, t) -> str:
+        """
+        serialize a single rdflib term
+        :param t: URIRef or Literal to serialize
+        :return: turtle representation of the term
+        """
+        if isinstance(t, Literal):
+            lexical = quote_literal(str(t))
+            if t.datatype is not None:
+                return f'{lexical}^^{self.term(t.datatype)}'
+            if t.language:
+                return f'{lexical}@{t.language}'
+            return lexical
+        split = max(t.rfind('/'), t.rfind('#')) + 1
+        prefix = self.prefixes.get(t[:split])
+        if prefix is not None and SAFE_LOCAL.match(t[split:]):
+            return f'{prefix}:{t[split:]}'
+        return f'<{t}>'
+
+    def add(self, triple: tuple) -> None:
+        """
+        write a triple, same signature as rdflib.Graph.add
+        :param triple: tuple of subject, predicate and object
+        """
+        s, p, o = triple
+        if s != self._subject:
+            self._subject = s
+            self._seen.clear()
+        elif triple in self._seen:
+            return
+        self._seen.add(triple)
+        self.file.write(f'{self.term(s)} {self.term(p)} {self.term(o)} .\n')
+        self.count += 1
+
+    def tell(self) -> int:
+        """
+        :return: number of bytes written so far
+        """
+        self.file.flush()
+        return self.file.tell()
+
+    def close(self) -> None:
+        self.file.close()
@@ -0,0 +1,83 @@
+import errno
+import os
+
+# errors of copy_file_range and sendfile for file systems or kernels that do not support them
+ZERO_COPY_ERRORS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP}
+
+
+def read_header(ttl_file: str) -> tuple:
+    """
+    read the @prefix lines at the top of a turtle file, the rest of the file is not read
+    :param ttl_file: location of the turtle file
+    :return: list of stripped prefix lines and byte offset of the first line after them
+    """
+    prefixes = []
+    offset = 0
+    with open(ttl_file, 'rb') as file:
+        for line in file:
+            if not line.startswith(b'@prefix'):
+                break
+            prefixes.append(line.decode('utf-8').strip())
+            offset += len(line)
+    return prefixes, offset
+
+
+def replace_prefix_uris(prefixes: list, replacements: dict) -> list:
+    """
+    replace the namespace uri of prefix lines
+    :param prefixes: prefix lines in the form '@prefix name: <uri> .'
+    :param replacements: dictionary of prefix name -> new uri
+    :return: list of prefix lines
+    """
+    replaced = []
+    for prefix in prefixes:
+        parts = prefix.split(' ')
+        if parts[1][:-1] in replacements:
+            parts[2] = f'<{replacements[parts[1][:-1]]}>'
+        replaced.append(' '.join(parts))
+    return replaced
+
+
+def copy_body(source_file: str, offset: int, target, chunk_size: int = 1 << 24) -> int:
+    """
+    append a file from offset to its end to an open file, in the kernel with copy_file_range or sendfile if possible
+    and in chunks of chunk_size bytes otherwise, so memory use does not depend on the size of the file
+    :param source_file: location of the file to copy from
+    :param offset: byte offset to start copying at, e.g. the end of the header returned by read_header
+    :param target: file object opened for writing in binary mode
+    :param chunk_size: maximum number of bytes copied per call
+    :return: number of bytes copied
+    """
+    target.flush()
+    out_fd = target.fileno()
+    with open(source_file, 'rb') as source:
+        in_fd = source.fileno()
+        end = os.fstat(in_fd).st_size
+        position = offset
+        for method in ('copy_file_range', 'sendfile'):
+            if not hasattr(os, method):
+                continue
+            try:
+                while position < end:
+                    if method == 'copy_file_range':
+                        copied = os.copy_file_range(in_fd, out_fd, min(chunk_size, end - position), position)
+                    else:
+                        copied = os.sendfile(out_fd, in_fd, position, min(chunk_size, end - position))
+                    if copied == 0:
+                        break
+                    position += copied
+                break
+            except OSError as e:
+                if e.errno not in ZERO_COPY_ERRORS:
+                    raise
+        # remaining bytes if the kernel can not copy between the files
+        source.seek(position)
+        while position < end:
+            chunk = source.read(min(chunk_size, end - position))
+            if not chunk:
+                break
+            target.write(chunk)
+            position += len(chunk)
+    # the kernel moved the position of the target, keep the file object in sync
+    target.seek(0, os.SEEK_END)
+    return position - offset
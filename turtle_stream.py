@@ -0,0 +1,156 @@
+import re
+from rdflib import URIRef, Literal, BNode
+from rdflib.namespace import XSD
+
+RDF_TYPE = URIRef('http://www.w3.org/1999/02/22-rdf-syntax-ns#type')
+
+# tokens of the turtle subset written by rdflib and create_triples.py
+TOKEN = re.compile(r'''
+    (?P<ws>\s+|\#[^\n]*)
+  | (?P<iri><[^<>"{}|^`\\\x00-\x20]*>)
+  | (?P<literal>(?P<string>"""(?:[^"\\]|\\.|"(?!""))*"""|\'\'\'(?:[^'\\]|\\.|'(?!''))*\'\'\'|"(?!"")(?:[^"\\\n\r]|\\.)*"|'(?!'')(?:[^'\\\n\r]|\\.)*')
+        (?:@(?P<lang>[a-zA-Z]+(?:-[a-zA-Z0-9]+)*)|\^\^(?P<datatype><[^<>"{}|^`\\\x00-\x20]*>|[A-Za-z][\w.-]*?:(?:[\w:%-]|\\.|\.(?=[\w:%-]))*))?)
+  | (?P<directive>@prefix|@base|PREFIX\b|BASE\b)
+  | (?P<bnode>_:[\w.-]*\w)
+  | (?P<number>[+-]?(?:\d+\.\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?|\d+[eE][+-]?\d+|\d+)(?![\w:]))
+  | (?P<boolean>(?:true|false)(?![\w:-]))
+  | (?P<a>a(?=[\s<"'\[]))
+  | (?P<pname>(?:[A-Za-z][\w.-]*?)?:(?:[\w:%-]|\\.|\.(?=[\w:%-]))*)
+  | (?P<punct>[;,.\[\]()])
+''', re.VERBOSE | re.DOTALL)
+
+ESCAPES = {'t': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+ESCAPE = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))', re.DOTALL)
+
+
+def _unescape(value: str) -> str:
+    if '\\' not in value:
+        return value
+    return ESCAPE.sub(lambda m: chr(int(m.group(1) or m.group(2), 16)) if m.group(3) is None else ESCAPES.get(m.group(3), m.group(3)), value)
+
+
+def _tokens(file):
+    """
+    split a turtle file into tokens, reading more lines only for literals spanning several lines
+    :param file: file object opened in text mode
+    :return: generator of (kind, match) tuples
+    """
+    buf = ''
+    pos = 0
+    for line in file:
+        buf = buf[pos:] + line if pos < len(buf) else line
+        pos = 0
+        while pos < len(buf):
+            m = TOKEN.match(buf, pos)
+            if m is None:
+                break
+            pos = m.end()
+            if m.lastgroup != 'ws':
+                yield m.lastgroup, m
+        else:
+            continue
+        if not buf.startswith(('"""', "'''"), pos):
+            # anything but an unterminated long string is a syntax error
+            raise ValueError(f'can not parse turtle near: {buf[pos:pos + 80]!r}')
+    if pos < len(buf) and buf[pos:].strip():
+        raise ValueError(f'can not parse turtle near: {buf[pos:pos + 80]!r}')
+
+
+class TurtleReader:
+    """
+    stream triples from a turtle or n-triples file without building an rdflib graph
+    supports the subset of turtle written by rdflib and create_triples.py: prefix directives,
+    predicate and object lists, literals with language or datatype and labelled blank nodes.
+    prefixes holds the namespace bindings read so far.
+    """
+    def __init__(self, graph_file: str):
+        self.graph_file = graph_file
+        self.prefixes = {}
+
+    def _resolve(self, pname: str) -> URIRef:
+        prefix, local = pname.split(':', 1)
+        if prefix not in self.prefixes:
+            raise ValueError(f'undefined prefix {prefix}: in {self.graph_file}')
+        return URIRef(self.prefixes[prefix] + _unescape(local))
+
+    def _term(self, kind: str, m):
+        if kind == 'iri':
+            return URIRef(_unescape(m.group()[1:-1]))
+        if kind == 'pname':
+            return self._resolve(m.group())
+        if kind == 'literal':
+            string = m.group('string')
+            quote = 3 if string[:3] in ('"""', "'''") else 1
+            value = _unescape(string[quote:-quote])
+            datatype = m.group('datatype')
+            if datatype is not None:
+                datatype = URIRef(datatype[1:-1]) if datatype.startswith('<') else self._resolve(datatype)
+                return Literal(value, datatype=datatype)
+            return Literal(value, lang=m.group('lang'))
+        if kind == 'a':
+            return RDF_TYPE
+        if kind == 'number':
+            value = m.group()
+            if 'e' in value or 'E' in value:
+                return Literal(value, datatype=XSD.double)
+            return Literal(value, datatype=XSD.decimal if '.' in value else XSD.integer)
+        if kind == 'boolean':
+            return Literal(m.group(), datatype=XSD.boolean)
+        if kind == 'bnode':
+            return BNode(m.group()[2:])
+        raise ValueError(f'unsupported turtle syntax {m.group()!r} in {self.graph_file}')
+
+    def __iter__(self):
+        """
+        :return: generator of (subject, predicate, object) tuples of rdflib terms
+        """
+        with open(self.graph_file, 'r', encoding='utf-8') as file:
+            tokens = _tokens(file)
+            for kind, m in tokens:
+                if kind == 'directive':
+                    directive = m.group()
+                    if directive.lower().endswith('base'):
+                        raise ValueError(f'base directives are not supported in {self.graph_file}')
+                    _, prefix = next(tokens)
+                    _, iri = next(tokens)
+                    self.prefixes[prefix.group()[:-1]] = _unescape(iri.group()[1:-1])
+                    if directive == '@prefix':
+                        next(tokens)
+                    continue
+
+                subject = self._term(kind, m)
+                kind, m = next(tokens)
+                while True:
+                    predicate = self._term(kind, m)
+                    while True:
+                        yield subject, predicate, self._term(*next(tokens))
+                        kind, sep = next(tokens)
+                        if sep.group() != ',':
+                            break
+                    if sep.group() == '.':
+                        break
+                    if sep.group() != ';':
+                        raise ValueError(f'expected ; or . but found {sep.group()!r} in {self.graph_file}')
+                    kind, m = next(tokens)
+                    # predicate lists may contain repeated or trailing semicolons
+                    while kind == 'punct' and m.group() == ';':
+                        kind, m = next(tokens)
+                    if kind == 'punct' and m.group() == '.':
+                        break
+
+
+def read_prefixes(graph_file: str) -> dict:
+    """
+    read the prefix bindings at the top of a turtle file
+    :param graph_file: location of the turtle file
+    :return: dictionary mapping prefixes to namespace uris
+    """
+    prefixes = {}
+    with open(graph_file, 'r', encoding='utf-8') as file:
+        for line in file:
+            m = re.match(r'^\s*(?:@prefix|PREFIX)\s+([\w.-]*):\s*<([^>]*)>', line)
+            if m:
+                prefixes[m.group(1)] = m.group(2)
+            elif line.strip() and not line.lstrip().startswith('#'):
+                break
+    return prefixes
@@ -2,45 +2,66 @@ from rdflib import Graph, URIRef, Literal
 from tqdm import tqdm
 import pandas as pd
 import argparse
+from graph_patch import load_predictions, patch_graph
+from turtle_stream import read_prefixes
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--graph_file', default='data/graph.ttl', type=str, help='ttl file containing the graph to update')
-parser.add_argument('--prediction_file', default='data/uslp-triplets.csv', type=str, help='csv file containing uslp predictions')
-parser.add_argument('--output_file', default='updated_graph.ttl', type=str, help='file location to write updated graph to')
-parser.add_argument('--cut_off', default=1.5, type=float, help='minimum score to achieve for updates to occur')
-args = parser.parse_args()
-
-# import unlinked knowledge graph
-print('- loading Graph Data')
-g = Graph()
-g.parse(args.graph_file)
-
-# import uslp predictions
-predictions = pd.read_csv(args.prediction_file, skip_blank_lines=True, sep='\t')
-predictions = predictions[['s', 'p', 'o', 'literal', 'score']]
-
-# extract namespace for uri reconstruction
-namespace = {key: uri for key, uri in g.namespaces()}
-
-def cast_uri(term:str, namespace:dict) -> URIRef:
-    """
-    reconstruct term in prefix:fragment form into full uri and create URIRef Object
-    :param term: term in prefix:fragment form
-    :param namespace: dictionary containing URIRef objects ordered by their associated short forms
-    :return: URIRef Object containing the reconstructed full URI
-    """
-    prefix, fragment = term.split(':')
-    return namespace[prefix] + fragment # select URIRef object and append fragment
-
-# replace old triplets with new predictions
-for idx, row in tqdm(predictions.iterrows(), total=len(predictions), desc='- removing old and inserting new triplets'):
-    if row['score'] > args.cut_off:
-        subject = cast_uri(row['s'], namespace)
-        predicate = cast_uri(row['p'], namespace)
-        obj = cast_uri(row['o'], namespace)
-        literal = Literal(row['literal'])
-        g.remove((subject, predicate, literal))
-        g.add((subject, predicate, obj))
-
-print(f'- store changed Graph to {args.output_file}')
-g.serialize(args.output_file, format="turtle", encoding="utf-8")
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--graph_file', default='data/graph.ttl', type=str, help='ttl file containing the graph to update')
+    parser.add_argument('--prediction_file', default='data/uslp-triplets.csv', type=str, help='csv file containing uslp predictions')
+    parser.add_argument('--output_file', default='updated_graph.ttl', type=str, help='file location to write updated graph to')
+    parser.add_argument('--cut_off', default=1.5, type=float, help='minimum score to achieve for updates to occur')
+    parser.add_argument('--engine', default='stream', choices=['stream', 'rdflib'], help='stream patches the triples while copying the file, rdflib loads the graph and serializes it again')
+    args = parser.parse_args(argv)
+
+    if args.engine == 'stream':
+        namespaces = read_prefixes(args.graph_file)
+
+        # accepted predictions by subject, predicate and literal
+        print('- loading predictions')
+        accepted = load_predictions(args.prediction_file, namespaces, args.cut_off)
+
+        print(f'- replacing literals while writing {args.output_file}')
+        replaced, added = patch_graph(args.graph_file, args.output_file, accepted, namespaces)
+        print(f'- replaced {replaced} literals, added {added} triples without a matching literal')
+
+    else:
+        # import unlinked knowledge graph
+        print('- loading Graph Data')
+        g = Graph()
+        g.parse(args.graph_file)
+
+        # import uslp predictions
+        predictions = pd.read_csv(args.prediction_file, skip_blank_lines=True, sep='\t')
+        predictions = predictions[['s', 'p', 'o', 'literal', 'score']]
+
+        # extract namespace for uri reconstruction
+        namespace = {key: uri for key, uri in g.namespaces()}
+
+        def cast_uri(term:str, namespace:dict) -> URIRef:
+            """
+            reconstruct term in prefix:fragment form into full uri and create URIRef Object
+            :param term: term in prefix:fragment form
+            :param namespace: dictionary containing URIRef objects ordered by their associated short forms
+            :return: URIRef Object containing the reconstructed full URI
+            """
+            prefix, fragment = term.split(':')
+            return namespace[prefix] + fragment # select URIRef object and append fragment
+
+        # replace old triplets with new predictions
+        for idx, row in tqdm(predictions.iterrows(), total=len(predictions), desc='- removing old and inserting new triplets'):
+            if row['score'] > args.cut_off:
+                subject = cast_uri(row['s'], namespace)
+                predicate = cast_uri(row['p'], namespace)
+                obj = cast_uri(row['o'], namespace)
+                literal = Literal(row['literal'])
+                g.remove((subject, predicate, literal))
+                g.add((subject, predicate, obj))
+
+        print(f'- store changed Graph to {args.output_file}')
+        g.serialize(args.output_file, format="turtle", encoding="utf-8")
+
+
+if __name__ == '__main__':
+    main()
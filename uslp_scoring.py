@@ -0,0 +1,241 @@
+from collections import OrderedDict
+import numpy as np
+from sklearn.preprocessing import normalize
+
+
+class LiteralSimilarity:
+    """
+    cosine similarity between candidate labels and literals, computed in float32 tiles when needed
+    embeddings are normalized once, similarities of a literal with all candidates are computed as one column and kept
+    in a least recently used cache. tiles and cache together stay within memory_budget bytes, so memory use does not
+    depend on the number of literals.
+    int8 candidate embeddings, as written by embedding_store.save_quantized_matrix, are kept as they are. their per
+    vector scales cancel out in the cosine similarity, so rows are converted and normalized while computing a tile.
+    """
+    def __init__(self, candidate_embeddings: np.ndarray, literal_embeddings: np.ndarray, memory_budget: int = 1 << 30,
+                 row_chunk: int = 1 << 16):
+        """
+        :param candidate_embeddings: label embedding of every candidate, float or int8 codes
+        :param literal_embeddings: embedding of every literal
+        :param memory_budget: maximum size of cached and computed similarities in bytes
+        :param row_chunk: number of int8 candidate rows converted to float32 at once
+        """
+        self.row_chunk = row_chunk
+        self.literals = np.asarray(literal_embeddings, dtype=np.float32)
+        self.inverse_norms = None
+        if np.asarray(candidate_embeddings).dtype == np.int8:
+            self.candidates = candidate_embeddings
+            norms = np.zeros(len(candidate_embeddings), dtype=np.float32)
+            for start in range(0, len(candidate_embeddings), row_chunk):
+                norms[start:start + row_chunk] = np.linalg.norm(candidate_embeddings[start:start + row_chunk].astype(np.float32), axis=1)
+            self.inverse_norms = np.divide(1, norms, out=np.zeros_like(norms), where=norms > 0)
+        else:
+            self.candidates = np.asarray(candidate_embeddings, dtype=np.float32)
+        # same normalization as sklearn's cosine_similarity, zero vectors get a similarity of 0
+        if len(self.candidates) and len(self.literals):
+            if self.inverse_norms is None:
+                self.candidates = normalize(self.candidates)
+            self.literals = normalize(self.literals)
+        column_size = max(1, len(self.candidates)) * 4
+        # half of the budget for cached columns, the other half for the tile that is computed
+        self.max_columns = max(2, memory_budget // 2 // column_size)
+        self.cache = OrderedDict()
+        self.computed = 0
+
+    def _compute(self, literals: list) -> None:
+        for start in range(0, len(literals), self.max_columns):
+            chunk = literals[start:start + self.max_columns]
+            # a single column would be computed as matrix vector product with a different summation order,
+            # so at least two columns are computed to get the same values as the full matrix product
+            columns = self.literals[chunk + chunk[:1] if len(chunk) == 1 else chunk].T
+            if self.inverse_norms is None:
+                tile = self.candidates @ columns
+            else:
+                tile = np.empty((len(self.candidates), columns.shape[1]), dtype=np.float32)
+                for row in range(0, len(self.candidates), self.row_chunk):
+                    rows = slice(row, row + self.row_chunk)
+                    tile[rows] = (self.candidates[rows].astype(np.float32) @ columns) * self.inverse_norms[rows, None]
+            for j, literal in enumerate(chunk):
+                self.cache[literal] = np.ascontiguousarray(tile[:, j])
+                while len(self.cache) > self.max_columns:
+                    self.cache.popitem(last=False)
+            self.computed += len(chunk)
+
+    def prefetch(self, literals) -> None:
+        """
+        compute the similarities of literals that are not cached yet in as few tiles as possible
+        :param literals: codes of literals, should fit into the cache at once
+        """
+        self._compute([literal for literal in dict.fromkeys(int(literal) for literal in literals) if literal not in self.cache])
+
+    def column(self, literal: int) -> np.ndarray:
+        """
+        :param literal: code of the literal
+        :return: similarity of the literal with every candidate
+        """
+        if literal not in self.cache:
+            self._compute([literal])
+        self.cache.move_to_end(literal)
+        return self.cache[literal]
+
+    def block(self, candidates: np.ndarray, literals: np.ndarray) -> np.ndarray:
+        """
+        :param candidates: positions of candidates
+        :param literals: codes of literals, should fit into the cache at once
+        :return: similarity matrix with one row per literal and one column per candidate
+        """
+        distinct = list(dict.fromkeys(int(literal) for literal in literals))
+        self.prefetch(distinct)
+        columns = {literal: self.column(literal)[candidates] for literal in distinct}
+        return np.stack([columns[int(literal)] for literal in literals]) if len(literals) else np.zeros((0, len(candidates)), dtype=np.float32)
+
+
+class USLPScorer:
+    """
+    compute uslp scores of subjects against candidates with integer coded lookups
+    every candidate is represented by the code of its geohash cell per precision and the code of its type, so the score
+    of a subject against all candidates is a gather from the precomputed matrices followed by an argmax.
+    the terms are added in float64 and in the same order as the per candidate computation in match_entities.py, but
+    distances and literal similarities are float32, so scores agree with it up to float32 rounding and near ties can
+    pick a different candidate. the literal similarities also depend on the tile width, which follows the memory budget.
+    exact ties are resolved towards the first candidate like idxmax. if preferred candidates are given, ties are
+    resolved towards the first preferred candidate among the best ones instead.
+    with prune=True only candidates in geohash cells that can reach the best score are evaluated. the bound of a cell
+    is its distance term plus the largest type terms and the largest literal similarity of its candidates, so the
+    result is the same as scoring all candidates.
+    """
+    def __init__(self, distance_matrices: dict, candidate_cells: dict, candidate_types: np.ndarray,
+                 type_similarity: np.ndarray, literal_similarity: LiteralSimilarity, type_contained: np.ndarray,
+                 block_size: int = 1 << 22, prune: bool = False, prune_size: int = 1024):
+        """
+        :param distance_matrices: precision -> normalized closeness between subject cells (rows) and candidate cells
+        :param candidate_cells: precision -> cell code of every candidate in the columns of the distance matrix
+        :param candidate_types: type code of every candidate
+        :param type_similarity: cosine similarity between types (rows) and predicates
+        :param literal_similarity: cosine similarity between candidates and literals
+        :param type_contained: bonus for predicates (rows) containing the type name
+        :param block_size: maximum number of scores held in memory at once
+        :param prune: skip candidates in cells that can not reach the best score
+        :param prune_size: number of candidates in the most promising cells scored to find the initial best score
+        """
+        self.distance_matrices = distance_matrices
+        self.candidate_cells = candidate_cells
+        self.candidate_types = candidate_types
+        self.type_similarity = type_similarity
+        self.literal_similarity = literal_similarity
+        self.type_contained = type_contained
+        self.block_size = block_size
+        self.prune = prune
+        self.prune_size = prune_size
+        # slack for the different order of additions in the bound
+        self.epsilon = 1e-9
+        self.evaluated = 0
+
+    def score(self, precision: int, predicate: int, cells: np.ndarray, literals: np.ndarray, selected: np.ndarray,
+              preferred: np.ndarray = None) -> tuple:
+        """
+        find the best candidate for a batch of subjects sharing a predicate
+        :param precision: geohash precision used for the predicate
+        :param predicate: code of the predicate
+        :param cells: cell code of every subject at the given precision
+        :param literals: literal code of every subject
+        :param selected: positions of the candidates to consider
+        :param preferred: optional boolean mask over all candidates, preferred candidates win ties for the best score
+        :return: position of the best candidate and its score for every subject
+        """
+        if self.prune and len(selected) > self.prune_size:
+            return self._score_pruned(precision, predicate, cells, literals, selected, preferred)
+        types = self.candidate_types[selected]
+        candidate_cells = self.candidate_cells[precision][selected]
+        # terms that only depend on the candidate are the same for every subject of the predicate
+        type_similarity = self.type_similarity[types, predicate].astype(np.float64)
+        type_contained = self.type_contained[predicate, types].astype(np.float64)
+        selected_preferred = preferred[selected] if preferred is not None else None
+
+        best = np.zeros(len(cells), dtype=np.int64)
+        scores = np.zeros(len(cells), dtype=np.float64)
+        # subjects are processed in the order of their literals, so the literal similarities of a block can be reused
+        by_literal = np.argsort(literals, kind='stable')
+        step = max(1, min(self.block_size // max(1, len(selected)), self.literal_similarity.max_columns))
+        for start in range(0, len(cells), step):
+            subjects = by_literal[start:start + step]
+            block = self.distance_matrices[precision][np.ix_(cells[subjects], candidate_cells)].astype(np.float64)
+            block += type_similarity
+            block += self.literal_similarity.block(selected, literals[subjects])
+            block += type_contained
+            position = block.argmax(axis=1)
+            if selected_preferred is not None:
+                position = self._prefer(block, position, selected_preferred)
+            best[subjects] = selected[position]
+            scores[subjects] = block[np.arange(len(position)), position]
+        self.evaluated += len(cells) * len(selected)
+        return best, scores
+
+    @staticmethod
+    def _prefer(block: np.ndarray, position: np.ndarray, preferred: np.ndarray) -> np.ndarray:
+        """
+        :param block: scores of subjects (rows) against candidates
+        :param position: column of the first best score of every row
+        :param preferred: boolean mask over the columns
+        :return: column of the first preferred best score of every row that has one, position otherwise
+        """
+        tied = (block == block[np.arange(len(position)), position][:, None]) & preferred
+        has_preferred = tied.any(axis=1)
+        position = position.copy()
+        position[has_preferred] = tied[has_preferred].argmax(axis=1)
+        return position
+
+    def _exact(self, precision: int, predicate: int, cell: int, literal: int, positions: np.ndarray) -> np.ndarray:
+        types = self.candidate_types[positions]
+        scores = self.distance_matrices[precision][cell, self.candidate_cells[precision][positions]].astype(np.float64)
+        scores += self.type_similarity[types, predicate]
+        scores += self.literal_similarity.column(literal)[positions]
+        scores += self.type_contained[predicate, types]
+        self.evaluated += len(positions)
+        return scores
+
+    def _score_pruned(self, precision: int, predicate: int, cells: np.ndarray, literals: np.ndarray, selected: np.ndarray,
+                      preferred: np.ndarray = None) -> tuple:
+        # group the selected candidates by cell, candidates within a cell stay in ascending order
+        candidate_cells = self.candidate_cells[precision][selected]
+        order = np.argsort(candidate_cells, kind='stable')
+        grouped = selected[order]
+        cell_ids, starts, counts = np.unique(candidate_cells[order], return_index=True, return_counts=True)
+        types = self.candidate_types[grouped]
+        type_terms = self.type_similarity[types, predicate].astype(np.float64) + self.type_contained[predicate, types]
+        cell_type_bound = np.maximum.reduceat(type_terms, starts)
+
+        # largest literal similarity per cell, shared by all subjects with the same literal, which are processed in a row
+        literal_bounds = {}
+
+        best = np.zeros(len(cells), dtype=np.int64)
+        scores = np.zeros(len(cells), dtype=np.float64)
+        by_literal = np.argsort(literals, kind='stable')
+        distinct = np.unique(literals)
+        for i in by_literal:
+            cell, literal = cells[i], literals[i]
+            if literal not in literal_bounds:
+                if literal not in self.literal_similarity.cache:
+                    position = np.searchsorted(distinct, literal)
+                    self.literal_similarity.prefetch(distinct[position:position + self.literal_similarity.max_columns])
+                literal_bounds.clear()
+                literal_bounds[literal] = np.maximum.reduceat(self.literal_similarity.column(literal)[grouped], starts).astype(np.float64)
+            bounds = self.distance_matrices[precision][cell, cell_ids] + cell_type_bound + literal_bounds[literal] + self.epsilon
+
+            # score the candidates of the most promising cells to get a lower bound for the best score
+            ranked = np.argsort(-bounds, kind='stable')
+            top = np.zeros(len(cell_ids), dtype=bool)
+            top[ranked[:np.searchsorted(np.cumsum(counts[ranked]), self.prune_size) + 1]] = True
+            initial = grouped[np.repeat(top, counts)]
+            threshold = self._exact(precision, predicate, cell, literal, initial).max()
+
+            # every candidate that can reach the best score is in a cell with a bound of at least the threshold
+            positions = np.sort(grouped[np.repeat(bounds >= threshold, counts)])
+            candidate_scores = self._exact(precision, predicate, cell, literal, positions)
+            position = candidate_scores.argmax()
+            if preferred is not None:
+                # candidates tied for the best score reach the threshold, so they are all in positions
+                position = self._prefer(candidate_scores[None], np.array([position]), preferred[positions])[0]
+            best[i] = positions[position]
+            scores[i] = candidate_scores[position]
+        return best, scores
@@ -1,10 +1,11 @@
 import os
 import argparse
-import requests
 import sys
 
 import time
 from datetime import timedelta
+from pipeline import Pipeline, Stage
+from downloads import Downloader, FASTTEXT_URL, GEOFABRIK_URL, geofabrik_urls
 
 parser = argparse.ArgumentParser()
 group_input = parser.add_mutually_exclusive_group(required=True)
@@ -12,52 +13,101 @@ group_input.add_argument('--input_file', type=str, help='PBF file containing OSM
 group_input.add_argument('--download_osm', action='store_true', default=False, help='toggle direct download of osm file from geofabrik')
 group_fasttext = parser.add_mutually_exclusive_group(required=True)
 group_fasttext.add_argument('--download_fasttext', action='store_true', default=False, help='toggle direct download of fasttext from fbai')
-group_fasttext.add_argument('--fasttext_file', type=str, help='location of fasttext binaries')
+group_fasttext.add_argument('--fasttext_file', type=str, help='location of fasttext binaries or of a vector store compiled with fasttext_store.py')
 parser.add_argument('--geofabrik_name', type=str, help='name of pbf file to download, such as europe/liechtenstein or australia-oceania')
+parser.add_argument('--base_url', type=str, default=GEOFABRIK_URL, help='address of geofabrik or of a mirror with the same layout')
+parser.add_argument('--fasttext_url', type=str, default=FASTTEXT_URL, help='address of the fasttext binaries to download')
 parser.add_argument('--output_file', type=str, default='updated_graph.ttl', help='name of file containing connected WorldKG triples')
 parser.add_argument('--cut_off', default=1.5, type=float, help='minimum score to achieve for predicted links to be considered')
+parser.add_argument('--force', nargs='*', choices=['create_triples', 'generate_entities', 'generate_embeddings', 'match_entities', 'update_graph'], help='stages to run even if their outputs are up to date, all stages if none is named')
+parser.add_argument('--stage_file', type=str, help='file recording the fingerprints of finished stages, .stages.json in data_dir by default')
+parser.add_argument('--data_dir', type=str, default='data', help='directory for the intermediate files, runs with different directories can run at the same time')
+parser.add_argument('--workers', type=int, default=1, help='number of processes used by the stages that run in parallel')
+parser.add_argument('--match_cache', type=str, help='sqlite database keeping matches across runs, match_cache.sqlite in data_dir by default')
+parser.add_argument('--generate_entities', action='store_true', default=False, help='extract candidate and subject tables from the graph in a separate stage instead of while creating triples')
 args = parser.parse_args()
 
 
+# the pbf file and the fasttext binaries are streamed to disk at the same time, interrupted downloads are resumed
+downloader = Downloader(workers=2)
 if args.download_osm:
     if args.geofabrik_name:
         print(f'Downloading OSM File: {args.geofabrik_name}')
-        r = requests.get(f'https://download.geofabrik.de/{args.geofabrik_name}-latest.osm.pbf')
-        with open(f'{os.path.basename(args.geofabrik_name)}-latest.osm.pbf', 'wb') as f:
-            f.write(r.content)
-        print('- finished download')
-        pbf_file = f'{os.path.basename(args.geofabrik_name)}-latest.osm.pbf'
+        url, md5_url = geofabrik_urls(args.geofabrik_name, args.base_url)
+        pbf_download = downloader.submit(url, f'{os.path.basename(args.geofabrik_name)}-latest.osm.pbf', md5_url)
     else:
         raise ValueError('no region name for geofabrik stated')
-else:
-    pbf_file = args.input_file
 
 # download fasttext binaries
 if args.download_fasttext:
     print('- downloading fasttext binaries')
-    r = requests.get('https://dl.fbaipublicfiles.com/fasttext/vectors-crawl/cc.en.300.bin.gz')
-    with open('cc.en.300.bin.gz', 'wb') as f:
-        f.write(r.content)
-    print('- finished download')
-    ft_file = 'cc.en.300.bin.gz'
-else:
-    ft_file = args.fasttext_file
+    ft_download = downloader.submit(args.fasttext_url, os.path.basename(args.fasttext_url))
+
+pbf_file = pbf_download.result() if args.download_osm else args.input_file
+ft_file = ft_download.result() if args.download_fasttext else args.fasttext_file
+downloader.close()
 
 
 start = time.time()
 print('Start generating WorldKG Graph')
 
-if not os.path.exists('data/'):
+if not os.path.exists(args.data_dir):
     print('- creating data directory')
-    os.makedirs('data')
+    os.makedirs(args.data_dir)
+
 
-os.system(f"python create_triples.py --input_file {pbf_file}")
-os.system("python generate_entities.py")
-os.system(f"python generate_embeddings.py --fasttext_file {ft_file}")
-os.system("python match_entities.py")
-os.system(f"python update_graph.py --output_file {args.output_file} --cut_off {args.cut_off}")
+def data(name: str) -> str:
+    return os.path.join(args.data_dir, name)
+
+
+# stages run in this process and are skipped if their inputs and arguments did not change since their last run
+# candidate and subject tables are collected while creating triples unless generate_entities.py is run as its own stage
+graph_file, prediction_file = data('graph.ttl'), data('uslp-triplets.csv')
+candidate_file, subject_file = data('candidates.parquet.zip'), data('subjects.parquet.zip')
+candidate_output, candidate_embeddings, subject_output = data('candidates_embedding.parquet.zip'), data('candidates_embedding.npy'), data('subjects_embedding.parquet.zip')
+predicate_map, literal_map, type_map = data('predicate_map.parquet'), data('literal_map.parquet'), data('type_map.parquet')
+workers = ['--workers', args.workers]
+entity_files = ['--candidate_file', candidate_file, '--subject_file', subject_file]
+entity_inputs = ['required files/relations.csv', 'required files/relevant_classes.csv']
+if args.generate_entities:
+    stages = [
+        Stage('create_triples', ['--input_file', pbf_file, '--output_file', graph_file, '--shard_dir', data('shards'),
+                                 '--location_file', data('node_locations.bin')] + workers,
+              inputs=[pbf_file, 'required files/OSM_Ontology_map_features.csv', 'required files/Key_List.csv'],
+              outputs=[graph_file]),
+        Stage('generate_entities', ['--graph_file', graph_file] + entity_files,
+              inputs=[graph_file] + entity_inputs, outputs=[candidate_file, subject_file]),
+    ]
+else:
+    stages = [
+        Stage('create_triples', ['--input_file', pbf_file, '--entity_tables', '--output_file', graph_file] + entity_files +
+                                ['--shard_dir', data('shards'), '--location_file', data('node_locations.bin')] + workers,
+              inputs=[pbf_file, 'required files/OSM_Ontology_map_features.csv', 'required files/Key_List.csv'] + entity_inputs,
+              outputs=[graph_file, candidate_file, subject_file]),
+    ]
+stages += [
+    Stage('generate_embeddings', ['--fasttext_file', ft_file, '--candidate_input', candidate_file, '--subject_input', subject_file,
+                                  '--candidate_output', candidate_output, '--candidate_embeddings', candidate_embeddings,
+                                  '--subject_output', subject_output, '--predicate_map', predicate_map,
+                                  '--literal_map', literal_map, '--type_map', type_map] + workers,
+          inputs=[ft_file, candidate_file, subject_file],
+          outputs=[candidate_output, candidate_embeddings, subject_output, predicate_map, literal_map, type_map]),
+    Stage('match_entities', ['--candidate_file', candidate_output, '--candidate_embeddings', candidate_embeddings,
+                             '--subject_file', subject_output, '--predicate_map', predicate_map, '--literal_map', literal_map,
+                             '--type_map', type_map, '--output_file', prediction_file,
+                             '--match_cache', args.match_cache or data('match_cache.sqlite')] + workers,
+          inputs=[candidate_output, candidate_embeddings, subject_output, predicate_map, literal_map, type_map,
+                  'required files/geohash_precision.json', 'required files/relation_types.json'],
+          outputs=[prediction_file]),
+    Stage('update_graph', ['--graph_file', graph_file, '--prediction_file', prediction_file,
+                           '--output_file', args.output_file, '--cut_off', args.cut_off],
+          inputs=[graph_file, prediction_file], outputs=[args.output_file]),
+]
+pipeline = Pipeline(stages, args.stage_file or data('.stages.json'))
+summary = pipeline.run(args.force)
 
 print('Finished generation')
 end = time.time()
 
-print(f"- Total runtime: {timedelta(seconds=end - start)}")
\ No newline at end of file
+pipeline.report(summary)
+print(f"- Total runtime: {timedelta(seconds=end - start)}")